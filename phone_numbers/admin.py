@@ -36,4 +36,4 @@ class CallQueueAdmin(admin.ModelAdmin):
     list_display = ('phone_number', 'created_at', 'priority')
     list_filter = ('priority',)
     search_fields = ('phone_number__number',)
-    ordering = ['created_at']
+    ordering = ['-priority', 'created_at']
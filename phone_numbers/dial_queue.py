@@ -0,0 +1,80 @@
+"""
+Очередь заданий для SIP-дозвонщика (см. dialer.py).
+
+Модуль не зависит от pjsua, поэтому его можно импортировать из задач Celery.
+"""
+import json
+
+from .redis_client import get_redis
+
+# Приоритеты очереди звонков: чем больше значение, тем раньше звонок
+QUEUE_PRIORITY_DEFAULT = 0
+QUEUE_PRIORITY_MANUAL = 10
+
+DIAL_QUEUE_KEY = 'dialer:jobs'
+# Каждый дозвонщик периодически публикует число свободных каналов
+DIALER_FREE_SLOTS_KEY = 'dialer:free_slots:{}'
+DIALER_FREE_SLOTS_TTL = 30
+# Флаг уже запланированного разбора очереди звонков
+DISPATCH_PENDING_KEY = 'callqueue:dispatch_pending'
+DISPATCH_PENDING_TTL = 10
+
+# Ожидания дозвонщика вокруг самого звонка (секунды)
+REGISTRATION_TIMEOUT = 10
+HANGUP_TIMEOUT = 5
+# Сколько звонок может ждать разрешения лимита CPS, прежде чем вернуться в очередь
+RATE_LIMIT_TIMEOUT = 60
+
+
+def stuck_call_timeout(max_call_duration):
+    """
+    Через сколько секунд без обновления updated_at номер в 'in_progress'
+    считается зависшим. Дозвонщик обновляет updated_at, когда берет задание
+    и когда получает токен CPS, поэтому порог покрывает самый долгий из
+    отрезков: ожидание регистрации и токена или сам звонок с отбоем.
+    """
+    return max(
+        max_call_duration * 2,
+        REGISTRATION_TIMEOUT + RATE_LIMIT_TIMEOUT,
+        max_call_duration + HANGUP_TIMEOUT
+    )
+
+
+def enqueue_dial(phone_id, priority=QUEUE_PRIORITY_DEFAULT):
+    """Передает номер дозвонщику; priority нужен, чтобы вернуть номер в очередь с ним же"""
+    get_redis().rpush(DIAL_QUEUE_KEY, json.dumps({'phone_id': phone_id, 'priority': priority}))
+
+
+def report_free_slots(dialer_id, free_slots):
+    """Публикует число свободных каналов дозвонщика (ключ истекает, если процесс умер)"""
+    get_redis().set(DIALER_FREE_SLOTS_KEY.format(dialer_id), free_slots, ex=DIALER_FREE_SLOTS_TTL)
+
+
+def free_dial_slots():
+    """
+    Возвращает, сколько звонков можно отдать дозвонщикам прямо сейчас:
+    свободные каналы всех живых дозвонщиков минус уже ожидающие задания
+    """
+    redis_client = get_redis()
+    keys = list(redis_client.scan_iter(DIALER_FREE_SLOTS_KEY.format('*')))
+    free_slots = sum(int(value) for value in redis_client.mget(keys) if value) if keys else 0
+    return max(0, free_slots - redis_client.llen(DIAL_QUEUE_KEY))
+
+
+def notify_call_queue():
+    """
+    Запускает разбор очереди звонков, не дожидаясь периодической задачи.
+    Пока запуск уже запланирован, повторные уведомления схлопываются в него.
+    """
+    try:
+        if get_redis().set(DISPATCH_PENDING_KEY, 1, nx=True, ex=DISPATCH_PENDING_TTL):
+            from .tasks import process_call_queue
+            process_call_queue.delay()
+    except Exception as e:
+        # Очередь все равно будет разобрана периодической задачей
+        print(f"Error notifying call queue dispatcher: {str(e)}")
+
+
+def clear_call_queue_notification():
+    """Снимает флаг запланированного разбора, чтобы новые уведомления снова запускали его"""
+    get_redis().delete(DISPATCH_PENDING_KEY)
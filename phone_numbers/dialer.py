@@ -0,0 +1,382 @@
+"""
+Долгоживущий SIP-дозвонщик.
+
+PJSUA инициализируется один раз на процесс, аккаунт остается
+зарегистрированным, а задания на звонок приходят через список в Redis.
+"""
+import os
+import json
+import signal
+import socket
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pjsua as pj
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .dial_queue import (
+    DIAL_QUEUE_KEY, REGISTRATION_TIMEOUT, HANGUP_TIMEOUT, RATE_LIMIT_TIMEOUT, QUEUE_PRIORITY_DEFAULT,
+    notify_call_queue, report_free_slots
+)
+from .rate_limit import wait_for_call_slot
+from .redis_client import get_redis
+from .signals import recording_finalized
+
+OUTBOUND_DOMAIN = os.getenv('SIP_OUTBOUND_DOMAIN', 'nyc.us.out.didww.com')
+
+# Ограничение PJSUA_MAX_CALLS, с которым собрана библиотека
+PJSUA_MAX_CALLS = 32
+
+
+# Logging callback
+def log_cb(level, msg, length):
+    try:
+        print(msg.decode('utf-8'))
+    except UnicodeDecodeError:
+        print("Logging error: Unable to decode message.")
+
+# Call state callback
+class CallCallback(pj.CallCallback):
+    def __init__(self, lib, call=None):
+        super().__init__(call)
+        self.lib = lib
+        self.recorder_id = None
+        self.recording_filename = None
+        # Путь, длительность и размер закрытой записи
+        self.finalized_recording = None
+        # Устанавливается, когда звонок завершен и запись закрыта
+        self.disconnected = threading.Event()
+
+    def on_state(self):
+        print(f"Call state: {self.call.info().state_text}")
+        if self.call.info().state == pj.CallState.DISCONNECTED:
+            try:
+                if self.recorder_id is not None:
+                    try:
+                        self.lib.recorder_destroy(self.recorder_id)
+                        print(f"Recorder destroyed for: {self.recording_filename}")
+                        self.finalized_recording = self._describe_recording()
+                    except pj.Error as e:
+                        print(f"Error destroying recorder: {str(e)}")
+                    self.recorder_id = None
+            finally:
+                # Иначе дозвонщик держит канал до max_call_duration
+                self.disconnected.set()
+
+    def _describe_recording(self):
+        """Параметры уже закрытого рекордером файла записи или None, если файла нет"""
+        path = self.recording_filename
+        try:
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Recording is not available: {str(e)}")
+            return None
+        try:
+            with wave.open(path, 'rb') as wav:
+                duration = wav.getnframes() / float(wav.getframerate())
+        except (wave.Error, EOFError):
+            duration = 0.0
+        return {'path': path, 'duration': duration, 'size': size}
+
+    def on_media_state(self):
+        if self.call.info().media_state == pj.MediaState.ACTIVE:
+            call_slot = self.call.info().conf_slot
+            try:
+                # Create recordings directory if it doesn't exist
+                recordings_dir = os.path.join(settings.RECORDINGS_DIR, self.call.info().remote_uri.split('@')[0].split(':')[1])
+                if not os.path.exists(recordings_dir):
+                    os.makedirs(recordings_dir)
+
+                # Generate recording filename
+                self.recording_filename = os.path.join(
+                    recordings_dir,
+                    f"call_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
+                )
+
+                # Create recorder and connect call slot to recorder slot
+                self.recorder_id = self.lib.create_recorder(self.recording_filename)
+                rec_slot = self.lib.recorder_get_slot(self.recorder_id)
+                self.lib.conf_connect(call_slot, rec_slot)
+                print(f"Recording started: {self.recording_filename}")
+            except pj.Error as e:
+                print(f"Error setting up recorder: {str(e)}")
+
+# Account callback
+class AccountCallback(pj.AccountCallback):
+    def __init__(self, account=None):
+        super().__init__(account)
+        self.registered = threading.Event()
+
+    def on_reg_state(self):
+        info = self.account.info()
+        print(f"Registration state: {info.reg_status} ({info.reg_reason})")
+        if info.reg_status == 200:
+            self.registered.set()
+        else:
+            self.registered.clear()
+
+
+class Dialer:
+    """
+    Держит одну инициализированную библиотеку PJSUA и зарегистрированный
+    аккаунт на все время жизни процесса и выполняет задания из Redis.
+    """
+
+    def __init__(self):
+        self.lib = None
+        self.acc = None
+        self.acc_cb = None
+        self.stopping = False
+        self.max_calls = 1
+        self.executor = None
+        self.active_calls = 0
+        self._active_lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._active_lock)
+        self._thread_state = threading.local()
+        self.dialer_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        """Инициализирует PJSUA, транспорт и регистрирует аккаунт"""
+        sip_user = os.getenv('SIP_USER')
+        sip_domain = os.getenv('SIP_DOMAIN')
+        sip_realm = os.getenv('SIP_AUTH_REALM')
+        sip_username = os.getenv('SIP_AUTH_USERNAME')
+        sip_password = os.getenv('SIP_AUTH_PASSWORD')
+
+        if not all([sip_user, sip_domain, sip_realm, sip_username, sip_password]):
+            raise Exception("SIP credentials not found in environment variables")
+
+        print(f"Using SIP credentials: user={sip_user}, domain={sip_domain}, realm={sip_realm}")
+
+        # Библиотека и пул потоков рассчитаны на максимум PJSUA, а сколько
+        # каналов из них занимать, run() перечитывает из настроек перед
+        # каждым заданием - перезапуск после смены max_concurrent_calls не нужен
+        self.max_calls = self._read_max_calls()
+        self.executor = ThreadPoolExecutor(max_workers=PJSUA_MAX_CALLS, thread_name_prefix='dial')
+        print(f"Dialer channels: {self.max_calls}")
+
+        self.lib = pj.Lib()
+
+        # Configure the library with enhanced settings
+        media_cfg = pj.MediaConfig()
+        media_cfg.no_vad = True
+        media_cfg.enable_ice = True
+        media_cfg.clock_rate = 16000
+
+        # Configure NAT and UA settings
+        ua_cfg = pj.UAConfig()
+        ua_cfg.force_lr = True
+        ua_cfg.user_agent = "PJSUA v2.14.1 NAT"
+        ua_cfg.max_calls = PJSUA_MAX_CALLS
+        ua_cfg.nameserver = ["8.8.8.8", "8.8.4.4"]
+
+        # Initialize library with logging
+        self.lib.init(
+            ua_cfg=ua_cfg,
+            log_cfg=pj.LogConfig(level=4, callback=log_cb),
+            media_cfg=media_cfg
+        )
+
+        # Use NULL sound device
+        self.lib.set_null_snd_dev()
+        print("Using NULL audio device")
+
+        # Create UDP transport with proper IP configuration
+        transport_cfg = pj.TransportConfig()
+        transport_cfg.public_addr = os.getenv('LOCAL_IP')
+        transport = self.lib.create_transport(pj.TransportType.UDP, transport_cfg)
+        print(f"Transport created with public address {transport_cfg.public_addr}")
+        print(f"Local binding: {transport.info().host}:{transport.info().port}")
+
+        self.lib.start()
+
+        # Configure SIP account with enhanced NAT settings
+        acc_cfg = pj.AccountConfig()
+        acc_cfg.id = f"sip:{sip_user}@{sip_domain}"
+        acc_cfg.reg_uri = f"sip:{sip_domain}"
+        acc_cfg.auth_cred = [pj.AuthCred(
+            sip_realm,
+            sip_username,
+            sip_password
+        )]
+
+        acc_cfg.allow_contact_rewrite = True
+        acc_cfg.contact_rewrite_method = 2
+        acc_cfg.contact_force_contact = f"sip:{sip_user}@{os.getenv('LOCAL_IP')}"
+        acc_cfg.reg_timeout = 300
+        # Диапазона с запасом хватает на PJSUA_MAX_CALLS одновременных звонков
+        acc_cfg.rtp_port = 10000
+        acc_cfg.rtp_port_range = 1000
+
+        # Аккаунт перерегистрируется самим PJSUA по reg_timeout
+        self.acc_cb = AccountCallback()
+        self.acc = self.lib.create_account(acc_cfg, cb=self.acc_cb)
+        print("Waiting for registration...")
+        if not self.acc_cb.registered.wait(REGISTRATION_TIMEOUT):
+            print("Registration is not confirmed yet, continuing")
+
+    def stop(self):
+        """Освобождает аккаунт и библиотеку"""
+        self.stopping = True
+        if self.executor:
+            # Дожидаемся завершения активных звонков до уничтожения библиотеки
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        if self.acc:
+            try:
+                self.acc.delete()
+            except pj.Error as e:
+                print(f"Error deleting account: {str(e)}")
+            self.acc = None
+        if self.lib:
+            try:
+                print("Destroying library...")
+                self.lib.destroy()
+            except Exception as e:
+                print(f"Error destroying library: {str(e)}")
+            self.lib = None
+
+    def run(self):
+        """
+        Основной цикл: забирает задания из Redis, пока есть свободные каналы,
+        и выполняет каждый звонок в отдельном потоке
+        """
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+        redis_client = get_redis()
+        print(f"Dialer is waiting for jobs in {DIAL_QUEUE_KEY}")
+        while not self.stopping:
+            self._update_max_calls()
+            self._report_free_slots()
+            # Таймауты нужны, чтобы периодически проверять флаг остановки
+            if not self._wait_for_slot(timeout=5):
+                continue
+            item = redis_client.blpop(DIAL_QUEUE_KEY, timeout=5)
+            if item is None:
+                continue
+            self._change_active_calls(1)
+            self.executor.submit(self._run_job, item[1])
+        report_free_slots(self.dialer_id, 0)
+
+    def _read_max_calls(self):
+        from .models import Settings
+        max_calls = int(Settings.get_value('max_concurrent_calls', '4'))
+        return max(1, min(max_calls, PJSUA_MAX_CALLS))
+
+    def _update_max_calls(self):
+        """Перечитывает max_concurrent_calls; при уменьшении лишние звонки просто доигрывают"""
+        try:
+            max_calls = self._read_max_calls()
+        except Exception as e:
+            print(f"Error reading max_concurrent_calls: {str(e)}")
+            return
+        if max_calls != self.max_calls:
+            print(f"Dialer channels: {self.max_calls} -> {max_calls}")
+            self.max_calls = max_calls
+
+    def _wait_for_slot(self, timeout):
+        with self._slot_freed:
+            return self._slot_freed.wait_for(lambda: self.active_calls < self.max_calls, timeout)
+
+    def _change_active_calls(self, delta):
+        with self._slot_freed:
+            self.active_calls += delta
+            self._slot_freed.notify()
+        self._report_free_slots()
+
+    def _report_free_slots(self):
+        try:
+            report_free_slots(self.dialer_id, max(0, self.max_calls - self.active_calls))
+        except Exception as e:
+            print(f"Error reporting free dialer slots: {str(e)}")
+
+    def _run_job(self, payload):
+        """Выполняет одно задание в потоке пула и освобождает канал"""
+        try:
+            # Потоки, созданные не PJSUA, должны быть зарегистрированы в библиотеке
+            if not getattr(self._thread_state, 'registered', False):
+                self.lib.thread_register(threading.current_thread().name)
+                self._thread_state.registered = True
+            close_old_connections()
+            job = json.loads(payload)
+            self.dial(job['phone_id'], job.get('priority', QUEUE_PRIORITY_DEFAULT))
+        except Exception as e:
+            print(f"Error processing dial job {payload}: {str(e)}")
+        finally:
+            close_old_connections()
+            self._change_active_calls(-1)
+            # Освободился канал - можно забрать из очереди следующий номер
+            notify_call_queue()
+
+    def _handle_signal(self, signum, frame):
+        print("Signal received, stopping dialer...")
+        self.stopping = True
+
+    def _touch(self, phone):
+        phone.updated_at = timezone.now()
+        type(phone).objects.filter(id=phone.id).update(updated_at=phone.updated_at)
+
+    def dial(self, phone_id, priority=QUEUE_PRIORITY_DEFAULT):
+        """
+        Звонит на номер и ждет завершения звонка.
+        priority - приоритет, с которым номер был в очереди звонков
+        """
+        from .models import PhoneNumber, Settings
+
+        phone = PhoneNumber.objects.get(id=phone_id)
+        print(f"Processing phone number: {phone.number}")
+        # check_stuck_calls отсчитывает время звонка от updated_at: время
+        # в очереди дозвонщика не должно считаться временем звонка
+        self._touch(phone)
+
+        if not self.acc_cb.registered.is_set():
+            print("Account is not registered, waiting...")
+            self.acc_cb.registered.wait(REGISTRATION_TIMEOUT)
+
+        # Лимит CPS транка общий для всех дозвонщиков
+        cps = float(Settings.get_value('outbound_cps', '1'))
+        cps_burst = int(Settings.get_value('outbound_cps_burst', '3'))
+        if not wait_for_call_slot(OUTBOUND_DOMAIN, cps, cps_burst, timeout=RATE_LIMIT_TIMEOUT):
+            print(f"CPS limit for {OUTBOUND_DOMAIN} exceeded, returning {phone.number} to the queue")
+            phone.add_to_queue(priority=priority)
+            return
+        # Ожидание регистрации и токена CPS тоже не должно считаться временем звонка
+        self._touch(phone)
+
+        call_cb = CallCallback(self.lib)
+        try:
+            uri = f"sip:{phone.number}@{OUTBOUND_DOMAIN}"
+            print(f"Dialing: {uri}")
+            call = self.acc.make_call(uri, cb=call_cb)
+
+            # Получаем максимальную длительность звонка из настроек (по умолчанию 60 секунд)
+            max_call_duration = int(Settings.get_value('max_call_duration', '60'))
+
+            # Ждем DISCONNECTED из on_state, но не дольше максимальной длительности
+            if call_cb.disconnected.wait(max_call_duration):
+                print(f"Call ended normally: {phone.number}")
+            else:
+                try:
+                    print(f"Call exceeded maximum duration of {max_call_duration}s, hanging up: {phone.number}")
+                    call.hangup()
+                except pj.Error as e:
+                    print(f"Error hanging up call: {str(e)}")
+                # Ждем, пока on_state закроет запись после отбоя
+                call_cb.disconnected.wait(HANGUP_TIMEOUT)
+
+        except pj.Error as e:
+            print(f"Error making call to {phone.number}: {str(e)}")
+
+        # Update phone record
+        phone.last_called_at = timezone.now()
+        phone.save()
+
+        # Передаем закрытую запись сразу на расшифровку, без сканирования каталога.
+        # Если запись не успела закрыться, ее подберут watch_recordings или сверка.
+        if call_cb.finalized_recording:
+            recording_finalized.send(sender=self.__class__, **call_cb.finalized_recording)
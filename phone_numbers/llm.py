@@ -0,0 +1,128 @@
+"""
+Общий клиент OpenAI для summary и разбора номеров.
+
+Все запросы идут через один пул HTTP-соединений процесса, с таймаутом
+и повтором с экспоненциальной задержкой и джиттером на 429/5xx и сетевых
+ошибках. chat_completion_batch выполняет пачку запросов параллельно
+в asyncio внутри одного воркера, не больше concurrency одновременно.
+"""
+import asyncio
+import random
+import time
+
+import aiohttp
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_MODEL = "gpt-4o-mini"
+REQUEST_TIMEOUT = 60
+MAX_RETRIES = 4
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+POOL_SIZE = 10
+DEFAULT_CONCURRENCY = 8
+
+_session = None
+
+
+def get_session():
+    """Сессия requests с пулом соединений, общая для процесса"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+        openai.requestssession = _session
+    return _session
+
+
+def is_retryable(error):
+    """429, 5xx, таймауты и обрывы соединения имеет смысл повторить"""
+    if isinstance(error, (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                          openai.error.Timeout, openai.error.APIConnectionError,
+                          asyncio.TimeoutError, aiohttp.ClientError)):
+        return True
+    if isinstance(error, openai.error.APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+def backoff_delay(attempt):
+    """Задержка перед повтором номер attempt (с нуля): full jitter"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _content(response):
+    return response.choices[0].message['content'].strip()
+
+
+def _params(messages, model, timeout, options):
+    # Неуказанные параметры (temperature, max_tokens, ...) остаются по умолчанию API
+    params = {key: value for key, value in options.items() if value is not None}
+    params.update(model=model, messages=messages, request_timeout=timeout)
+    return params
+
+
+def chat_completion(messages, model=DEFAULT_MODEL, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, **options):
+    """
+    Блокирующий запрос к chat completions, возвращает текст ответа.
+    В веб-запросах передавайте меньшие timeout и max_retries.
+    """
+    get_session()
+    for attempt in range(max_retries + 1):
+        try:
+            response = openai.ChatCompletion.create(**_params(messages, model, timeout, options))
+            return _content(response)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"OpenAI request failed ({str(e)}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def achat_completion(messages, model=DEFAULT_MODEL, timeout=REQUEST_TIMEOUT, **options):
+    """То же, что chat_completion, для asyncio"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await openai.ChatCompletion.acreate(**_params(messages, model, timeout, options))
+            return _content(response)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"OpenAI request failed ({str(e)}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def _run_batch(requests_messages, concurrency, **kwargs):
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        openai.aiosession.set(session)
+
+        async def run(messages):
+            async with semaphore:
+                try:
+                    return await achat_completion(messages, **kwargs)
+                except Exception as e:
+                    return e
+
+        try:
+            return await asyncio.gather(*(run(messages) for messages in requests_messages))
+        finally:
+            openai.aiosession.set(None)
+
+
+def chat_completion_batch(requests_messages, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """
+    Выполняет несколько запросов параллельно, не больше concurrency сразу.
+    Для каждого списка сообщений возвращает текст ответа или исключение,
+    с которым запрос не удался.
+    """
+    if not requests_messages:
+        return []
+    return asyncio.run(_run_batch(list(requests_messages), max(1, concurrency), **kwargs))
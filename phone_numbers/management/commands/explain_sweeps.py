@@ -0,0 +1,129 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from phone_numbers.models import PhoneNumber, CallRecord, CallQueue, Settings, TRANSCRIPT_UNRECOGNIZED
+from phone_numbers.tasks import (
+    stuck_calls, phones_missing_summary, phones_to_complete, phones_to_recall, pending_transcriptions,
+    unprocessed_recordings, SUMMARY_SWEEP_BATCH_SIZE, TRANSCRIBE_SWEEP_BATCH_SIZE
+)
+
+BATCH_SIZE = 10000
+
+
+def sweep_querysets():
+    """Запросы периодических задач: те же хелперы, что вызывает tasks.py"""
+    max_call_duration = int(Settings.get_value('max_call_duration', '60'))
+    recall_interval = int(Settings.get_value('recall_interval_hours', '24'))
+    batch_size = int(Settings.get_value('transcription_batch_size', '8'))
+    check_interval = int(Settings.get_value('recordings_check_interval', '5'))
+    recent = timezone.now() - timezone.timedelta(hours=1)
+    return [
+        ('check_stuck_calls', stuck_calls(max_call_duration)),
+        ('process_missing_summaries', phones_missing_summary().order_by('id')[:SUMMARY_SWEEP_BATCH_SIZE * 2]),
+        ('check_completed_status', phones_to_complete()),
+        ('schedule_recall', phones_to_recall(recall_interval)),
+        ('transcribe_call_record (pending)', pending_transcriptions().filter(
+            created_at__gte=recent
+        ).values_list('id', flat=True)[:batch_size * 2]),
+        ('process_unprocessed_recordings', unprocessed_recordings(check_interval).values_list(
+            'id', flat=True
+        )[:TRANSCRIBE_SWEEP_BATCH_SIZE]),
+        ('CallQueue.claim', CallQueue.claimable().select_related('phone_number')[:4]),
+    ]
+
+
+def sweep_indexes():
+    for model in (PhoneNumber, CallRecord, CallQueue):
+        yield from model._meta.indexes
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет БД тестовыми номерами внутри транзакции и печатает планы запросов '
+        'периодических задач с индексами и без них. Все изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Сколько номеров создать')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (только PostgreSQL)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['rows'])
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    for model in (PhoneNumber, CallRecord, CallQueue):
+                        cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+            # DROP INDEX откатывается вместе с вложенной транзакцией
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in sweep_indexes():
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+                self.stdout.write(self.style.MIGRATE_HEADING('=== Without sweep indexes ==='))
+                self.explain(options['analyze'])
+                transaction.set_rollback(True)
+
+            self.stdout.write(self.style.MIGRATE_HEADING('=== With sweep indexes ==='))
+            self.explain(options['analyze'])
+
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        self.stdout.write(f'Seeding {rows} phone numbers...')
+        started = time.monotonic()
+        now = timezone.now()
+        for start in range(0, rows, BATCH_SIZE):
+            phones = []
+            for i in range(start, min(start + BATCH_SIZE, rows)):
+                roll = random.random()
+                # Как в рабочей базе: почти все номера уже обработаны
+                if roll < 0.01:
+                    status, summary = 'in_progress', None
+                elif roll < 0.02:
+                    status, summary = 'pending', None
+                elif roll < 0.03:
+                    status, summary = 'failed', None
+                else:
+                    status, summary = 'completed', 'summary'
+                phones.append(PhoneNumber(
+                    number=f'bench{i}',
+                    status=status,
+                    summary=summary,
+                    last_called_at=now - timezone.timedelta(hours=random.uniform(0, 30))
+                ))
+            phones = PhoneNumber.objects.bulk_create(phones)
+
+            records = []
+            queue = []
+            for phone in phones:
+                if phone.status == 'failed':
+                    transcript = TRANSCRIPT_UNRECOGNIZED
+                elif phone.status == 'in_progress':
+                    transcript = ''
+                else:
+                    transcript = 'transcript'
+                records.append(CallRecord(
+                    phone_number=phone,
+                    audio_file=f'recordings/{phone.number}/call.wav',
+                    transcript=transcript,
+                    transcribed_at=now if transcript else None
+                ))
+                if phone.status == 'pending':
+                    queue.append(CallQueue(phone_number=phone))
+            CallRecord.objects.bulk_create(records)
+            CallQueue.objects.bulk_create(queue)
+        self.stdout.write(f'Seeded in {time.monotonic() - started:.1f}s')
+
+    def explain(self, analyze):
+        explain_options = {'analyze': True} if analyze and connection.vendor == 'postgresql' else {}
+        for name, queryset in sweep_querysets():
+            plan = queryset.explain(**explain_options)
+            if connection.vendor == 'postgresql':
+                name = f"{name} [{'Seq Scan' if 'Seq Scan' in plan else 'index'}]"
+            self.stdout.write(self.style.SUCCESS(f'--- {name}'))
+            self.stdout.write(plan)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from phone_numbers.dialer import Dialer
+
+
+class Command(BaseCommand):
+    help = 'Запускает долгоживущий SIP-дозвонщик, принимающий задания из Redis'
+
+    def handle(self, *args, **options):
+        dialer = Dialer()
+        try:
+            dialer.start()
+            dialer.run()
+        finally:
+            dialer.stop()
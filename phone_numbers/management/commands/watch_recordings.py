@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from phone_numbers.recordings import ingest_recording
+
+
+class RecordingEventHandler(FileSystemEventHandler):
+    """Создает CallRecord, как только рекордер закрыл файл записи"""
+
+    def on_closed(self, event):
+        if event.is_directory:
+            return
+        close_old_connections()
+        try:
+            ingest_recording(event.src_path)
+        except Exception as e:
+            print(f"Error ingesting recording {event.src_path}: {str(e)}")
+
+
+class Command(BaseCommand):
+    help = 'Следит за каталогом записей (inotify) и сразу ставит новые записи на расшифровку'
+
+    def handle(self, *args, **options):
+        recordings_dir = settings.RECORDINGS_DIR
+        os.makedirs(recordings_dir, exist_ok=True)
+
+        observer = Observer()
+        observer.schedule(RecordingEventHandler(), recordings_dir, recursive=True)
+        observer.start()
+        self.stdout.write(f'Watching {recordings_dir} for new recordings')
+        try:
+            while observer.is_alive():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            observer.stop()
+            observer.join()
@@ -1,15 +1,24 @@
 from django.db import migrations
 
+TABLE = 'phone_numbers_phonenumber'
+
+
+def drop_call_attempts(apps, schema_editor):
+    # Колонку уже убрала 0004; на новой БД удалять нечего, и DROP COLUMN падал бы
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        columns = [column.name for column in connection.introspection.get_table_description(cursor, TABLE)]
+    if 'call_attempts' in columns:
+        schema_editor.execute(f'ALTER TABLE {TABLE} DROP COLUMN call_attempts;')
+
+
 class Migration(migrations.Migration):
     dependencies = [
         ('phone_numbers', '0007_remove_phonenumber_call_attemptsed'),  # замените на имя последней миграции
     ]
 
     operations = [
-        migrations.RunSQL(
-            # SQL для удаления колонки
-            sql='ALTER TABLE phone_numbers_phonenumber DROP COLUMN call_attempts;',
-            # SQL для отката изменений
-            reverse_sql='ALTER TABLE phone_numbers_phonenumber ADD COLUMN call_attempts integer NOT NULL DEFAULT 0;'
-        ),
-    ]
\ No newline at end of file
+        # Удаление колонки, если она осталась от ручных правок схемы; откат ничего не делает,
+        # т.к. по состоянию миграций колонки здесь нет
+        migrations.RunPython(drop_call_attempts, migrations.RunPython.noop),
+    ]
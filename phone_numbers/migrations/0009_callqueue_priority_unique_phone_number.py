@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+def remove_duplicate_queue_items(apps, schema_editor):
+    """Оставляет по одной записи очереди на номер: с наибольшим приоритетом, затем самую старую"""
+    CallQueue = apps.get_model('phone_numbers', 'CallQueue')
+    seen = set()
+    duplicate_ids = []
+    for item in CallQueue.objects.order_by('phone_number_id', '-priority', 'created_at').only('id', 'phone_number_id'):
+        if item.phone_number_id in seen:
+            duplicate_ids.append(item.id)
+        else:
+            seen.add(item.phone_number_id)
+    CallQueue.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_numbers', '0008_remove_call_attempts_field'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_queue_items, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='callqueue',
+            options={'ordering': ['-priority', 'created_at']},
+        ),
+        migrations.AddConstraint(
+            model_name='callqueue',
+            constraint=models.UniqueConstraint(fields=('phone_number',), name='unique_call_queue_phone_number'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+def remove_duplicate_recordings(apps, schema_editor):
+    """Оставляет по одной записи звонка на файл: с расшифровкой, затем самую раннюю"""
+    CallRecord = apps.get_model('phone_numbers', 'CallRecord')
+    seen = set()
+    duplicate_ids = []
+    records = CallRecord.objects.exclude(audio_file='').exclude(audio_file__isnull=True)
+    for record in records.order_by('audio_file', '-transcript', 'created_at').only('id', 'audio_file'):
+        if record.audio_file.name in seen:
+            duplicate_ids.append(record.id)
+        else:
+            seen.add(record.audio_file.name)
+    CallRecord.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_numbers', '0009_callqueue_priority_unique_phone_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_recordings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='callrecord',
+            constraint=models.UniqueConstraint(condition=models.Q(('audio_file', ''), _negated=True), fields=('audio_file',), name='unique_call_record_audio_file'),
+        ),
+    ]
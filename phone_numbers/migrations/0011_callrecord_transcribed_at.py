@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_numbers', '0010_callrecord_unique_audio_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callrecord',
+            name='transcribed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_numbers', '0011_callrecord_transcribed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callqueue',
+            index=models.Index(fields=['-priority', 'created_at'], name='callqueue_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(condition=models.Q(('transcript', '')), fields=['created_at'], name='callrecord_untranscribed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['phone_number', 'transcribed_at'], name='callrecord_phone_transcr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phonenumber',
+            index=models.Index(fields=['status', 'updated_at'], name='phone_status_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phonenumber',
+            index=models.Index(fields=['last_called_at'], name='phone_last_called_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phonenumber',
+            index=models.Index(condition=models.Q(('summary__isnull', True)), fields=['id'], name='phone_no_summary_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phonenumber',
+            index=models.Index(condition=models.Q(('summary__isnull', False), models.Q(('status', 'completed'), _negated=True)), fields=['id'], name='phone_summary_pending_idx'),
+        ),
+    ]
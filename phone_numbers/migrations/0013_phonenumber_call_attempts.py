@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:59
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_call_attempts(apps, schema_editor):
+    """Заполняет счетчик по уже существующим записям звонков"""
+    PhoneNumber = apps.get_model('phone_numbers', 'PhoneNumber')
+    CallRecord = apps.get_model('phone_numbers', 'CallRecord')
+    counts = CallRecord.objects.filter(
+        phone_number=models.OuterRef('pk')
+    ).order_by().values('phone_number').annotate(count=models.Count('id')).values('count')
+    PhoneNumber.objects.update(
+        call_attempts=Coalesce(models.Subquery(counts), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_numbers', '0012_sweep_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phonenumber',
+            name='call_attempts',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_call_attempts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Значения по умолчанию, которые раньше создавались при добавлении каждого номера
+DEFAULT_SETTINGS = {
+    'recall_interval_hours': ('24', 'Hours between automatic recall attempts'),
+    'max_retries': ('3', 'Maximum number of retry attempts for failed calls'),
+    'transcription_model': ('base', 'Whisper model to use for transcription'),
+    'max_concurrent_calls': ('4', 'Maximum number of simultaneous outbound calls per dialer'),
+    'outbound_cps': ('1', 'Outbound calls per second allowed by the SIP trunk'),
+    'outbound_cps_burst': ('3', 'Number of calls that may start back to back before the CPS limit applies'),
+    'transcription_chunk_seconds': ('30', 'Maximum length of one audio chunk sent to the speech recognizer'),
+    'transcription_backend': ('google', 'Transcription backend: google or whisper (local, CPU)'),
+    'transcription_batch_size': ('8', 'Maximum number of recordings transcribed in one backend pass'),
+    'summary_debounce_seconds': ('30', 'Delay that collapses repeated summary requests for a number into one'),
+    'summary_incremental': ('1', 'Update the existing summary with new transcripts only (1) or rebuild it from all transcripts (0)'),
+    'llm_concurrency': ('8', 'Maximum parallel OpenAI requests when summarizing numbers in batch'),
+}
+
+
+def seed_default_settings(apps, schema_editor):
+    """Создает недостающие настройки, уже заданные значения не трогает"""
+    Settings = apps.get_model('phone_numbers', 'Settings')
+    existing = set(Settings.objects.values_list('key', flat=True))
+    Settings.objects.bulk_create([
+        Settings(key=key, value=value, description=description)
+        for key, (value, description) in DEFAULT_SETTINGS.items()
+        if key not in existing
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_numbers', '0013_phonenumber_call_attempts'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_default_settings, migrations.RunPython.noop),
+    ]
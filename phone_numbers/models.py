@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 import os
+import time
 from django.conf import settings
+from .redis_client import get_redis
+from .dial_queue import QUEUE_PRIORITY_DEFAULT
 
 STATUS_CHOICES = [
     ('pending', 'Ожидает'),
@@ -17,6 +20,19 @@ STATUS_TOOLTIPS = {
     'failed': 'Возникли ошибки в процессе обработки',
 }
 
+# Значения transcript для записей, которые не удалось расшифровать
+TRANSCRIPT_UNRECOGNIZED = "Audio could not be transcribed"
+TRANSCRIPT_ERROR = "Error during transcription"
+FAILED_TRANSCRIPTS = (TRANSCRIPT_UNRECOGNIZED, TRANSCRIPT_ERROR)
+
+# Размер пачки для массового импорта номеров
+BULK_BATCH_SIZE = 1000
+
+# Настройки читаются из памяти процесса; раз в SETTINGS_CACHE_TTL секунд
+# сверяется версия в Redis, которую увеличивает каждое изменение настроек
+SETTINGS_CACHE_TTL = 5
+SETTINGS_VERSION_KEY = 'settings:version'
+
 class PhoneNumber(models.Model):
     number = models.CharField(max_length=20, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -26,11 +42,29 @@ class PhoneNumber(models.Model):
     summary = models.TextField(blank=True, null=True)
     summary_updated_at = models.DateTimeField(null=True, blank=True)
     processing_time = models.DurationField(null=True, blank=True)
+    # Число записей звонков; меняется только через F() в signals.py
+    call_attempts = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # check_stuck_calls: status='in_progress' и updated_at старше порога
+            models.Index(fields=['status', 'updated_at'], name='phone_status_updated_idx'),
+            # schedule_recall
+            models.Index(fields=['last_called_at'], name='phone_last_called_idx'),
+            # process_missing_summaries: номера без summary
+            models.Index(fields=['id'], condition=models.Q(summary__isnull=True), name='phone_no_summary_idx'),
+            # check_completed_status: есть summary, но статус еще не 'completed'
+            models.Index(
+                fields=['id'],
+                condition=models.Q(summary__isnull=False) & ~models.Q(status='completed'),
+                name='phone_summary_pending_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.number
     
-    def recall(self, reset_counter=False):
+    def recall(self, reset_counter=False, priority=QUEUE_PRIORITY_DEFAULT):
         """
         Метод для повторного набора номера
         При ручном вызове удаляет последнюю неудачную запись
@@ -49,7 +83,7 @@ class PhoneNumber(models.Model):
                 if last_record:
                     last_record.delete()
         
-        self.add_to_queue()
+        self.add_to_queue(priority=priority)
         return True
         
     def check_transcription_status(self):
@@ -57,33 +91,143 @@ class PhoneNumber(models.Model):
         Проверяет все записи звонков и обновляет статус,
         если все транскрипции неудачные
         """
-        records = self.call_records.all()
-        if not records.exists():
-            return
-            
-        all_failed = all(
-            record.transcript == "Audio could not be transcribed"
-            for record in records
-            if record.transcript  # проверяем только записи с транскрипцией
-        )
-        
-        # Проверяем, что все записи имеют транскрипцию
-        all_transcribed = all(record.transcript for record in records)
-        
-        if all_failed and all_transcribed:
+        if PhoneNumber.mark_failed_transcriptions(phone_ids=[self.pk]):
             self.status = 'failed'
-            self.save(update_fields=['status'])
 
-    def add_to_queue(self):
-        """Добавляет номер в очередь звонков"""
+    @classmethod
+    def mark_failed_transcriptions(cls, phone_ids=None):
+        """
+        Переводит в 'failed' номера, у которых есть записи и все они
+        не распознаны. Считается агрегатами в БД одним UPDATE.
+        phone_ids ограничивает проверку этими номерами.
+        Возвращает число обновленных номеров.
+        """
+        phones = cls.objects.exclude(status='failed')
+        if phone_ids is not None:
+            phones = phones.filter(id__in=phone_ids)
+
+        failed = phones.annotate(
+            records_count=models.Count('call_records'),
+            unrecognized_count=models.Count(
+                'call_records',
+                filter=models.Q(call_records__transcript=TRANSCRIPT_UNRECOGNIZED)
+            )
+        ).filter(
+            records_count__gt=0,
+            unrecognized_count=models.F('records_count')
+        ).exclude(
+            # Номер с summary вне очереди остается 'completed', как и при save()
+            models.Q(summary__gt='') &
+            ~models.Exists(CallQueue.objects.filter(phone_number=models.OuterRef('pk')))
+        )
+
+        return cls.objects.filter(id__in=failed.values('id')).update(status='failed')
+
+    def add_to_queue(self, priority=QUEUE_PRIORITY_DEFAULT):
+        """
+        Добавляет номер в очередь звонков.
+        Если номер уже ожидает в очереди, новая запись не создается,
+        а приоритет существующей только повышается.
+        """
         from .models import CallQueue
-        CallQueue.objects.create(phone_number=self)
+        queue_item, created = CallQueue.objects.get_or_create(
+            phone_number=self,
+            defaults={'priority': priority}
+        )
+        if not created and queue_item.priority < priority:
+            CallQueue.objects.filter(pk=queue_item.pk, priority__lt=priority).update(priority=priority)
+        # Сообщаем диспетчеру сразу после фиксации транзакции
+        from .dial_queue import notify_call_queue
+        transaction.on_commit(notify_call_queue)
         # Используем флаг для предотвращения рекурсии при сохранении
         self._skip_status_update = True
         self.status = 'pending'
         self.save()
         delattr(self, '_skip_status_update')
         
+    @classmethod
+    def bulk_import(cls, numbers, priority=QUEUE_PRIORITY_DEFAULT):
+        """
+        Массово добавляет номера и ставит их в очередь звонков.
+        То же, что create() + add_to_queue() для новых номеров и recall()
+        для уже существующих, но пачками по BULK_BATCH_SIZE в одной транзакции.
+        Возвращает (число новых номеров, число повторных).
+        """
+        numbers = list(dict.fromkeys(number for number in numbers if number))
+        if not numbers:
+            return 0, 0
+
+        with transaction.atomic():
+            existing = set()
+            for start in range(0, len(numbers), BULK_BATCH_SIZE):
+                existing.update(cls.objects.filter(
+                    number__in=numbers[start:start + BULK_BATCH_SIZE]
+                ).values_list('number', flat=True))
+            new_numbers = [number for number in numbers if number not in existing]
+
+            inserted = set()
+            for start in range(0, len(new_numbers), BULK_BATCH_SIZE):
+                inserted.update(cls._insert_new_numbers(new_numbers[start:start + BULK_BATCH_SIZE]))
+
+            phone_ids = []
+            new_ids = []
+            for start in range(0, len(numbers), BULK_BATCH_SIZE):
+                for phone_id, number in cls.objects.filter(
+                    number__in=numbers[start:start + BULK_BATCH_SIZE]
+                ).values_list('id', 'number'):
+                    phone_ids.append(phone_id)
+                    if number in inserted:
+                        new_ids.append(phone_id)
+
+            CallRecord.objects.bulk_create(
+                [CallRecord(phone_number_id=phone_id) for phone_id in new_ids],
+                batch_size=BULK_BATCH_SIZE
+            )
+            CallQueue.objects.bulk_create(
+                [CallQueue(phone_number_id=phone_id, priority=priority) for phone_id in phone_ids],
+                batch_size=BULK_BATCH_SIZE,
+                ignore_conflicts=True
+            )
+            for start in range(0, len(phone_ids), BULK_BATCH_SIZE):
+                batch = phone_ids[start:start + BULK_BATCH_SIZE]
+                CallQueue.objects.filter(phone_number_id__in=batch, priority__lt=priority).update(priority=priority)
+                cls.objects.filter(id__in=batch).exclude(status='pending').update(
+                    status='pending',
+                    updated_at=timezone.now()
+                )
+
+            from .dial_queue import notify_call_queue
+            transaction.on_commit(notify_call_queue)
+
+        return len(new_ids), len(numbers) - len(new_ids)
+
+    @classmethod
+    def _insert_new_numbers(cls, numbers):
+        """
+        Вставляет пачку номеров и возвращает те, которые вставил именно этот вызов.
+        Номер, который между проверкой и вставкой добавил другой запрос,
+        считается повторным: первую запись звонка ему создал тот запрос.
+        """
+        # Как и save(), у нового номера сразу есть первая запись звонка
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(
+                    [cls(number=number, status='pending', call_attempts=1) for number in numbers]
+                )
+            return numbers
+        except IntegrityError:
+            pass
+
+        inserted = []
+        for number in numbers:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create([cls(number=number, status='pending', call_attempts=1)])
+                inserted.append(number)
+            except IntegrityError:
+                continue
+        return inserted
+
     def save(self, *args, **kwargs):
         is_new = self.pk is None  # Проверяем, новый ли это объект
         
@@ -93,6 +237,14 @@ class PhoneNumber(models.Model):
             if not CallQueue.objects.filter(phone_number=self).exists():
                 self.status = 'completed'
         
+        # Счетчик попыток ведут сигналы CallRecord, полное сохранение
+        # устаревшего экземпляра не должно его перезаписывать
+        if not is_new and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'call_attempts'
+            ]
+        
         super().save(*args, **kwargs)
         
         # Если это новый объект, создаем первую запись в call_records
@@ -128,12 +280,6 @@ class PhoneNumber(models.Model):
         """Возвращает текст подсказки для текущего статуса"""
         return STATUS_TOOLTIPS.get(self.status, '')
     
-    @property
-    def call_attempts(self):
-        """
-        Возвращает реальное количество попыток звонка на основе записей
-        """
-        return self.call_records.count()
 
 
 class CallRecord(models.Model):
@@ -141,6 +287,23 @@ class CallRecord(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     audio_file = models.FileField(upload_to='recordings/', null=True, blank=True)
     transcript = models.TextField(blank=True)
+    transcribed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Один файл записи - одна запись звонка (пустые audio_file не учитываются)
+            models.UniqueConstraint(
+                fields=['audio_file'],
+                condition=~models.Q(audio_file=''),
+                name='unique_call_record_audio_file'
+            ),
+        ]
+        indexes = [
+            # Записи, ожидающие расшифровки (transcribe_call_record, process_unprocessed_recordings)
+            models.Index(fields=['created_at'], condition=models.Q(transcript=''), name='callrecord_untranscribed_idx'),
+            # Инкрементальное summary: новые транскрипции номера
+            models.Index(fields=['phone_number', 'transcribed_at'], name='callrecord_phone_transcr_idx'),
+        ]
     
     def get_audio_file_path(self):
         """
@@ -162,14 +325,59 @@ class CallRecord(models.Model):
 class CallQueue(models.Model):
     phone_number = models.ForeignKey(PhoneNumber, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
-    priority = models.IntegerField(default=0)  # Для возможного будущего приоритетного обзвона
+    priority = models.IntegerField(default=QUEUE_PRIORITY_DEFAULT)  # Чем больше, тем раньше звонок
     
     class Meta:
-        ordering = ['created_at']  # Сортировка по времени создания
+        ordering = ['-priority', 'created_at']  # Сначала приоритет, затем время создания
+        constraints = [
+            # Не больше одной ожидающей записи на номер
+            models.UniqueConstraint(fields=['phone_number'], name='unique_call_queue_phone_number'),
+        ]
+        indexes = [
+            # Порядок выборки в claim()
+            models.Index(fields=['-priority', 'created_at'], name='callqueue_priority_idx'),
+        ]
         
     def __str__(self):
         return f"Call queue item for {self.phone_number.number} created at {self.created_at}"
 
+    @classmethod
+    def claimable(cls):
+        """Записи очереди, которые можно забрать, в порядке приоритета"""
+        return cls.objects.exclude(phone_number__status='in_progress').order_by(*cls._meta.ordering)
+
+    @classmethod
+    def claim(cls, limit):
+        """
+        Атомарно забирает из очереди до limit номеров с учетом приоритета.
+        Строки, заблокированные другим воркером, пропускаются (SKIP LOCKED),
+        поэтому параллельные вызовы никогда не получат один и тот же номер.
+        Забранные номера переводятся в статус 'in_progress'.
+        Возвращает пары (номер, приоритет в очереди), чтобы при неудаче
+        вернуть номер в очередь с тем же приоритетом.
+        """
+        if limit <= 0:
+            return []
+
+        with transaction.atomic():
+            items = list(
+                cls.claimable().select_for_update(skip_locked=True, of=('self',))
+                .select_related('phone_number')[:limit]
+            )
+            if not items:
+                return []
+
+            cls.objects.filter(id__in=[item.id for item in items]).delete()
+            phones = [item.phone_number for item in items]
+            PhoneNumber.objects.filter(id__in=[phone.id for phone in phones]).update(
+                status='in_progress',
+                updated_at=timezone.now()
+            )
+
+        for phone in phones:
+            phone.status = 'in_progress'
+        return [(item.phone_number, item.priority) for item in items]
+
 class Settings(models.Model):
     key = models.CharField(max_length=50, unique=True)
     value = models.CharField(max_length=255)
@@ -181,9 +389,40 @@ class Settings(models.Model):
     def __str__(self):
         return self.key
 
+    _cache = None
+    _cache_version = None
+    _cache_checked_at = 0
+
     @classmethod
     def get_value(cls, key, default=None):
+        return cls.cached_values().get(key, default)
+
+    @classmethod
+    def cached_values(cls):
+        """
+        Все настройки в виде словаря из кэша процесса.
+        Таблица перечитывается, только если в Redis сменилась версия
+        настроек или Redis недоступен.
+        """
+        now = time.monotonic()
+        if cls._cache is not None and now - cls._cache_checked_at < SETTINGS_CACHE_TTL:
+            return cls._cache
+
+        try:
+            version = get_redis().get(SETTINGS_VERSION_KEY) or '0'
+        except Exception:
+            version = None
+        if cls._cache is None or version is None or version != cls._cache_version:
+            cls._cache = dict(cls.objects.values_list('key', 'value'))
+            cls._cache_version = version
+        cls._cache_checked_at = now
+        return cls._cache
+
+    @classmethod
+    def invalidate_cache(cls):
+        """Сбрасывает кэш этого процесса и сообщает об изменении остальным"""
+        cls._cache = None
         try:
-            return cls.objects.get(key=key).value
-        except cls.DoesNotExist:
-            return default
+            get_redis().incr(SETTINGS_VERSION_KEY)
+        except Exception as e:
+            print(f"Error publishing settings version: {str(e)}")
@@ -0,0 +1,156 @@
+"""
+Разбор списков номеров из вставленного текста или загруженного CSV/TXT.
+
+Файл читается построчно и разбирается локально; номера отдаются пачками,
+так что размер файла не ограничен памятью. Строки, в которых есть цифры,
+но не нашлось ни одного корректного номера, собираются отдельно - их по
+желанию пользователя можно отдать на разбор модели.
+"""
+import io
+import json
+import re
+import time
+
+from .llm import chat_completion
+
+# Номер: цифры, между которыми не больше одного разделителя (пробел, '-', '.')
+# и скобки кода; ячейки CSV режутся заранее
+PHONE_PATTERN = re.compile(r'\+?\(?\d(?:\)?[ \-\.]?\(?\d)+')
+CELL_SEPARATORS = re.compile(r'[,;\t|]')
+MIN_DIGITS = 10
+MAX_DIGITS = 15
+# Строки без номера, где цифр меньше, считаются не относящимися к номерам
+UNPARSED_MIN_DIGITS = 7
+# Сколько нераспознанных строк отправлять модели за один запрос
+LLM_FALLBACK_LINES = 200
+# Разбор идет внутри веб-запроса, поэтому ждем модель недолго
+LLM_FALLBACK_TIMEOUT = 20
+LLM_FALLBACK_RETRIES = 1
+# После этого времени новые запросы к модели не отправляются
+LLM_FALLBACK_DEADLINE = 45
+# Сколько нераспознанных строк держать в памяти; остальные только считаются
+UNPARSED_MAX_LINES = 1000
+
+LLM_PARSER_PROMPT = (
+    "You are a phone number parser. Extract all phone numbers from the input text and return them as a JSON "
+    "array of strings. Each number should contain only digits, no spaces or special characters. "
+    "Example output: [\"79991234567\",\"78889999999\"]"
+)
+
+
+def normalize_number(raw):
+    """
+    Приводит номер к виду, в котором он хранится: только цифры, как их
+    возвращает разбор через модель. Возвращает None для некорректных номеров.
+    """
+    digits = ''.join(char for char in str(raw) if char.isdigit())
+    if MIN_DIGITS <= len(digits) <= MAX_DIGITS:
+        return digits
+    return None
+
+
+def split_digit_run(match):
+    """
+    Делит слишком длинное совпадение на номера по пробелам: номера,
+    перечисленные через пробел, сливаются в одно совпадение. Группы
+    цифр набираются подряд, пока не наберется хотя бы MIN_DIGITS.
+    """
+    numbers = []
+    current = ''
+    for token in match.split():
+        current += ''.join(char for char in token if char.isdigit())
+        if len(current) >= MIN_DIGITS:
+            number = normalize_number(current)
+            if number:
+                numbers.append(number)
+            current = ''
+    return numbers
+
+
+def extract_phone_numbers(text):
+    """Извлекает и нормализует все номера из строки текста или CSV"""
+    numbers = []
+    for cell in CELL_SEPARATORS.split(text):
+        for match in PHONE_PATTERN.findall(cell):
+            number = normalize_number(match)
+            if number:
+                numbers.append(number)
+            elif sum(char.isdigit() for char in match) > MAX_DIGITS:
+                numbers.extend(split_digit_run(match))
+    return numbers
+
+
+class UnparsedLines:
+    """Нераспознанные строки: хранит не больше limit, считает все"""
+
+    def __init__(self, limit=UNPARSED_MAX_LINES):
+        self.limit = limit
+        self.lines = []
+        self.count = 0
+
+    def add(self, line):
+        self.count += 1
+        if len(self.lines) < self.limit:
+            self.lines.append(line)
+
+
+def iter_lines(upload, encoding='utf-8'):
+    """Построчно читает загруженный файл, не загружая его целиком"""
+    upload.seek(0)
+    yield from io.TextIOWrapper(upload.file, encoding=encoding, errors='replace', newline='')
+
+
+def iter_number_batches(lines, batch_size, unparsed):
+    """
+    Отдает списки номеров не длиннее batch_size, без повторов по всему входу.
+    Строки с цифрами, из которых не удалось извлечь номер, добавляются
+    в unparsed (UnparsedLines).
+    """
+    seen = set()
+    batch = []
+    for line in lines:
+        numbers = extract_phone_numbers(line)
+        if not numbers:
+            if sum(char.isdigit() for char in line) >= UNPARSED_MIN_DIGITS:
+                unparsed.add(line.strip())
+            continue
+        for number in numbers:
+            if number in seen:
+                continue
+            seen.add(number)
+            batch.append(number)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def parse_with_llm(lines, deadline=LLM_FALLBACK_DEADLINE):
+    """
+    Разбирает строки через модель, пачками по LLM_FALLBACK_LINES.
+    Новые пачки не начинаются позже deadline секунд от старта.
+    Возвращает (номера, число разобранных строк).
+    """
+    started = time.monotonic()
+    numbers = []
+    parsed = 0
+    for start in range(0, len(lines), LLM_FALLBACK_LINES):
+        if time.monotonic() - started > deadline:
+            break
+        chunk = lines[start:start + LLM_FALLBACK_LINES]
+        content = chat_completion(
+            [
+                {"role": "system", "content": LLM_PARSER_PROMPT},
+                {"role": "user", "content": "\n".join(chunk)}
+            ],
+            model="gpt-3.5-turbo",
+            timeout=LLM_FALLBACK_TIMEOUT,
+            max_retries=LLM_FALLBACK_RETRIES
+        )
+        for number in json.loads(content):
+            number = normalize_number(number)
+            if number:
+                numbers.append(number)
+        parsed += len(chunk)
+    return numbers, parsed
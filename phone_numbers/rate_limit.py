@@ -0,0 +1,73 @@
+"""
+Ограничение частоты исходящих звонков (CPS) на транк.
+
+Token bucket хранится в Redis и общий для всех дозвонщиков и воркеров,
+ключ - домен исходящего маршрута.
+"""
+import time
+
+from .redis_client import get_redis
+
+RATE_LIMIT_KEY = 'ratelimit:cps:{}'
+
+# Время берется из Redis (TIME), чтобы все процессы считали по одним часам.
+# Возвращает 0, если токен получен, иначе сколько секунд ждать следующего.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+_token_bucket = None
+
+
+def try_acquire(domain, rate, burst):
+    """
+    Пытается взять токен на один звонок через domain.
+    Возвращает 0, если звонить можно, иначе время ожидания в секундах.
+    """
+    global _token_bucket
+    if _token_bucket is None:
+        _token_bucket = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+    return float(_token_bucket(keys=[RATE_LIMIT_KEY.format(domain)], args=[rate, burst]))
+
+
+def wait_for_call_slot(domain, rate, burst, timeout=None):
+    """
+    Блокирует, пока лимит CPS транка не разрешит следующий звонок.
+    Возвращает False, если за timeout секунд токен получить не удалось.
+    """
+    if rate <= 0:
+        return True
+
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        try:
+            wait = try_acquire(domain, rate, burst)
+        except Exception as e:
+            # Без Redis не блокируем звонки, ограничением остается число каналов
+            print(f"Error checking CPS limit for {domain}: {str(e)}")
+            return True
+
+        if wait <= 0:
+            return True
+        if deadline is not None and time.time() + wait > deadline:
+            return False
+        time.sleep(wait)
@@ -0,0 +1,114 @@
+"""
+Прием записей звонков: создание CallRecord и постановка расшифровки.
+
+Основной путь - события закрытия файла (manage.py watch_recordings),
+периодическая сверка каталога (задача reconcile_recordings) остается запасным.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+RECORDING_EXTENSION = '.wav'
+WAV_HEADER_SIZE = 44
+# Файл, который не менялся столько секунд, считается дописанным
+RECORDING_SETTLE_SECONDS = 30
+
+
+def recording_relative_path(path):
+    """Путь к записи в том виде, в каком он хранится в CallRecord.audio_file"""
+    return os.path.relpath(os.path.abspath(path), settings.BASE_DIR)
+
+
+def ingest_recording(path, duration=None, size=None):
+    """
+    Создает CallRecord для файла записи и ставит его на расшифровку.
+    duration и size передает дозвонщик, если они уже известны; записи без
+    звука сразу помечаются нерасшифрованными, без похода в распознавание.
+    Файл может первым принять watch_recordings, без этих данных: тогда
+    повторный вызов от дозвонщика помечает пустую запись, если ее еще не
+    расшифровали. В остальных случаях повторный вызов ничего не делает.
+    Возвращает созданную запись или None.
+    """
+    from .models import PhoneNumber, CallRecord, TRANSCRIPT_UNRECOGNIZED
+    from .tasks import transcribe_call_record
+
+    if not path.endswith(RECORDING_EXTENSION):
+        return None
+
+    # Записи лежат в recordings/<номер>/call_*.wav
+    number = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    phone = PhoneNumber.objects.filter(number=number).first()
+    if phone is None:
+        print(f"Phone number {number} not found for recording {path}")
+        return None
+
+    audio_file = recording_relative_path(path)
+    with transaction.atomic():
+        is_empty = (size is not None and size <= WAV_HEADER_SIZE) or duration == 0
+        call_record, created = CallRecord.objects.get_or_create(
+            phone_number=phone,
+            audio_file=audio_file,
+            defaults={'transcript': TRANSCRIPT_UNRECOGNIZED if is_empty else ''}
+        )
+        if not created:
+            # Задача расшифровки, поставленная первым вызовом, пропустит запись
+            if is_empty and CallRecord.objects.filter(pk=call_record.pk, transcript='').update(
+                transcript=TRANSCRIPT_UNRECOGNIZED
+            ):
+                # update() не вызывает post_save, где это проверяется для save()
+                PhoneNumber.mark_failed_transcriptions(phone_ids=[phone.id])
+            return None
+        if not is_empty:
+            transaction.on_commit(lambda: transcribe_call_record.delay(call_record.id))
+
+    print(f"Recording ingested: {audio_file}")
+    return call_record
+
+
+def find_recent_recordings(max_age_seconds):
+    """
+    Ищет дописанные записи, измененные за последние max_age_seconds.
+    Каталоги номеров, в которые давно ничего не добавлялось, не просматриваются.
+    """
+    recordings_dir = settings.RECORDINGS_DIR
+    if not os.path.isdir(recordings_dir):
+        return []
+
+    now = time.time()
+    oldest = now - max_age_seconds
+    newest = now - RECORDING_SETTLE_SECONDS
+    found = []
+    with os.scandir(recordings_dir) as phone_dirs:
+        for phone_dir in phone_dirs:
+            # mtime каталога меняется при добавлении в него файла
+            if not phone_dir.is_dir() or phone_dir.stat().st_mtime < oldest:
+                continue
+            with os.scandir(phone_dir.path) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not entry.name.endswith(RECORDING_EXTENSION):
+                        continue
+                    mtime = entry.stat().st_mtime
+                    if oldest <= mtime <= newest:
+                        found.append(entry.path)
+    return found
+
+
+def ingest_missing_recordings(max_age_seconds):
+    """Догоняет записи, события о которых были пропущены. Возвращает число новых записей"""
+    from .models import CallRecord
+
+    candidates = {recording_relative_path(path): path for path in find_recent_recordings(max_age_seconds)}
+    if not candidates:
+        return 0
+
+    known = set(CallRecord.objects.filter(
+        audio_file__in=list(candidates)
+    ).values_list('audio_file', flat=True))
+
+    ingested = 0
+    for audio_file, path in candidates.items():
+        if audio_file not in known and ingest_recording(path):
+            ingested += 1
+    return ingested
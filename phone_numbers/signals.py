@@ -1,19 +1,47 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import PhoneNumber, Settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+from .models import PhoneNumber, Settings, CallRecord, TRANSCRIPT_UNRECOGNIZED
 
-@receiver(post_save, sender=PhoneNumber)
-def phone_number_post_save(sender, instance, created, **kwargs):
+# Отправляется дозвонщиком, когда рекордер закрыл файл записи.
+# Аргументы: path, duration (секунды), size (байты)
+recording_finalized = Signal()
+
+
+def _update_call_attempts(record, delta):
+    phones = PhoneNumber.objects.filter(pk=record.phone_number_id)
+    if delta < 0:
+        phones = phones.filter(call_attempts__gte=-delta)
+    phones.update(call_attempts=F('call_attempts') + delta)
+    # Экземпляр номера, через который создали запись, видит новое значение без перечитывания
+    if CallRecord.phone_number.is_cached(record):
+        record.phone_number.call_attempts = max(0, record.phone_number.call_attempts + delta)
+
+
+@receiver(post_save, sender=CallRecord)
+def call_record_post_save(sender, instance, created, **kwargs):
     if created:
-        # Ensure default settings exist
-        default_settings = {
-            'recall_interval_hours': ('24', 'Hours between automatic recall attempts'),
-            'max_retries': ('3', 'Maximum number of retry attempts for failed calls'),
-            'transcription_model': ('base', 'Whisper model to use for transcription')
-        }
-        
-        for key, (value, description) in default_settings.items():
-            Settings.objects.get_or_create(
-                key=key,
-                defaults={'value': value, 'description': description}
-            )
+        _update_call_attempts(instance, 1)
+
+    # Все записи номера могут стать нераспознанными только после записи такой транскрипции
+    if instance.transcript == TRANSCRIPT_UNRECOGNIZED:
+        PhoneNumber.mark_failed_transcriptions(phone_ids=[instance.phone_number_id])
+
+
+@receiver(post_delete, sender=CallRecord)
+def call_record_post_delete(sender, instance, **kwargs):
+    _update_call_attempts(instance, -1)
+
+
+@receiver(post_save, sender=Settings)
+@receiver(post_delete, sender=Settings)
+def settings_changed(sender, **kwargs):
+    # Другие процессы увидят новую версию не позже чем через SETTINGS_CACHE_TTL
+    transaction.on_commit(Settings.invalidate_cache)
+
+
+@receiver(recording_finalized)
+def recording_finalized_handler(sender, path, duration, size, **kwargs):
+    from .recordings import ingest_recording
+    ingest_recording(path, duration=duration, size=size)
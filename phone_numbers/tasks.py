@@ -1,82 +1,45 @@
 import os
-import openai
-from datetime import datetime
+import json
+import uuid
+import hashlib
+import logging
 from celery import shared_task
 from django.conf import settings
 from django.utils import timezone
 from django.db import models
 import speech_recognition as sr
-import pjsua as pj
-import time
 import glob
-from pathlib import Path
 from dotenv import load_dotenv
 from phone_tracker.celery import app  # Добавляем импорт app
+from .dial_queue import (
+    enqueue_dial, free_dial_slots, clear_call_queue_notification, stuck_call_timeout, QUEUE_PRIORITY_DEFAULT
+)
+from .transcription import get_backend
+from .redis_client import get_redis
+from .llm import chat_completion, chat_completion_batch, DEFAULT_CONCURRENCY
+from .recordings import ingest_recording, ingest_missing_recordings, recording_relative_path
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Проверяем загрузку переменных окружения
-print(f"SIP_USER: {os.getenv('SIP_USER')}")
-print(f"SIP_DOMAIN: {os.getenv('SIP_DOMAIN')}")
-print(f"SIP_AUTH_REALM: {os.getenv('SIP_AUTH_REALM')}")
-print(f"SIP_AUTH_USERNAME: {os.getenv('SIP_AUTH_USERNAME')}")
-
-# Logging callback
-def log_cb(level, msg, length):
-    try:
-        print(msg.decode('utf-8'))
-    except UnicodeDecodeError:
-        print("Logging error: Unable to decode message.")
-
-# Call state callback
-class CallCallback(pj.CallCallback):
-    def __init__(self, call=None):
-        super().__init__(call)
-        self.recorder_id = None
-        self.recording_filename = None
-
-    def on_state(self):
-        print(f"Call state: {self.call.info().state_text}")
-        if self.call.info().state == pj.CallState.DISCONNECTED:
-            if self.recorder_id is not None:
-                try:
-                    lib.recorder_destroy(self.recorder_id)
-                    print(f"Recorder destroyed for: {self.recording_filename}")
-                except pj.Error as e:
-                    print(f"Error destroying recorder: {str(e)}")
-                self.recorder_id = None
-
-    def on_media_state(self):
-        if self.call.info().media_state == pj.MediaState.ACTIVE:
-            call_slot = self.call.info().conf_slot
-            try:
-                # Create recordings directory if it doesn't exist
-                recordings_dir = os.path.join("recordings", self.call.info().remote_uri.split('@')[0].split(':')[1])
-                if not os.path.exists(recordings_dir):
-                    os.makedirs(recordings_dir)
-                
-                # Generate recording filename
-                self.recording_filename = os.path.join(
-                    recordings_dir,
-                    f"call_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
-                )
-                
-                # Create recorder and connect call slot to recorder slot
-                self.recorder_id = lib.create_recorder(self.recording_filename)
-                rec_slot = lib.recorder_get_slot(self.recorder_id)
-                lib.conf_connect(call_slot, rec_slot)
-                print(f"Recording started: {self.recording_filename}")
-            except pj.Error as e:
-                print(f"Error setting up recorder: {str(e)}")
-
-# Account callback
-class AccountCallback(pj.AccountCallback):
-    def __init__(self, account=None):
-        super().__init__(account)
-
-    def on_reg_state(self):
-        print(f"Registration state: {self.account.info().reg_status} ({self.account.info().reg_reason})")
+TRANSCRIBE_LOCK_KEY = 'transcribe:lock:{}'
+TRANSCRIBE_LOCK_TTL = 600
+# Запрос summary, уже ожидающий запуска generate_summary
+SUMMARY_PENDING_KEY = 'summary:pending:{}'
+SUMMARY_PENDING_GRACE = 60
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_OPTIONS = {"temperature": 0, "max_tokens": 2048}
+# Ответ модели по хешу модели и сообщений (промпт, прежнее summary, транскрипции)
+SUMMARY_CACHE_KEY = 'summary:cache:{}'
+SUMMARY_CACHE_TTL = 30 * 24 * 3600
+# Один проход process_missing_summaries за раз и не больше номеров за проход
+SUMMARY_SWEEP_LOCK_KEY = 'summary:sweep:lock'
+SUMMARY_SWEEP_LOCK_TTL = 600
+SUMMARY_SWEEP_BATCH_SIZE = 50
+# Сколько забытых записей process_unprocessed_recordings отправляет на расшифровку за проход
+TRANSCRIBE_SWEEP_BATCH_SIZE = 100
 
 # Отложенный импорт моделей
 def get_phone_number_model():
@@ -97,144 +60,34 @@ def get_call_queue_model():
 
 @shared_task
 def process_phone_number(phone_id):
-    """Process a phone number: make call and record conversation"""
-    global lib
-    lib = None
+    """
+    Передает номер долгоживущему дозвонщику (manage.py run_dialer).
+    Сам звонок, обновление last_called_at и проверка записей выполняются там.
+    """
     try:
-        phone = get_phone_number_model().objects.get(id=phone_id)
-        print(f"Processing phone number: {phone.number}")
-        if phone.call_attempts >= 15:
-            print(f"Skipping call to {phone.number} - maximum attempts (15) reached")
-            return
-        
-        
-        # Get SIP credentials
-        sip_user = os.getenv('SIP_USER')
-        sip_domain = os.getenv('SIP_DOMAIN')
-        sip_realm = os.getenv('SIP_AUTH_REALM')
-        sip_username = os.getenv('SIP_AUTH_USERNAME')
-        sip_password = os.getenv('SIP_AUTH_PASSWORD')
-
-        if not all([sip_user, sip_domain, sip_realm, sip_username, sip_password]):
-            raise Exception("SIP credentials not found in environment variables")
-
-        print(f"Using SIP credentials: user={sip_user}, domain={sip_domain}, realm={sip_realm}")
-        
-        # Initialize PJSUA library
-        lib = pj.Lib()
-        
-        # Configure the library with enhanced settings
-        media_cfg = pj.MediaConfig()
-        media_cfg.no_vad = True
-        media_cfg.enable_ice = True
-        media_cfg.clock_rate = 16000
-        
-        # Configure NAT and UA settings
-        ua_cfg = pj.UAConfig()
-        ua_cfg.force_lr = True
-        ua_cfg.user_agent = "PJSUA v2.14.1 NAT"
-        ua_cfg.max_calls = 1
-        ua_cfg.nameserver = ["8.8.8.8", "8.8.4.4"]
-
-        # Initialize library with logging
-        lib.init(
-            ua_cfg=ua_cfg,
-            log_cfg=pj.LogConfig(level=4, callback=log_cb),
-            media_cfg=media_cfg
-        )
-
-        # Use NULL sound device
-        lib.set_null_snd_dev()
-        print("Using NULL audio device")
-
-        # Create UDP transport with STUN and proper IP configuration
-        transport_cfg = pj.TransportConfig()
-        transport_cfg.public_addr = os.getenv('LOCAL_IP')
-        transport = lib.create_transport(pj.TransportType.UDP, transport_cfg)
-        print(f"Transport created with public address {transport_cfg.public_addr}")
-        print(f"Local binding: {transport.info().host}:{transport.info().port}")
-
-        # Start the library
-        lib.start()
-
-        # Configure SIP account with enhanced NAT settings
-        acc_cfg = pj.AccountConfig()
-        acc_cfg.id = f"sip:{sip_user}@{sip_domain}"
-        acc_cfg.reg_uri = f"sip:{sip_domain}"
-        acc_cfg.auth_cred = [pj.AuthCred(
-            sip_realm,
-            sip_username,
-            sip_password
-        )]
-        
-        # Enhanced NAT and media settings
-        acc_cfg.allow_contact_rewrite = True
-        acc_cfg.contact_rewrite_method = 2
-        acc_cfg.contact_force_contact = f"sip:{sip_user}@{os.getenv('LOCAL_IP')}"
-        acc_cfg.reg_timeout = 300
-        acc_cfg.rtp_port = 10000
-        acc_cfg.rtp_port_range = 1000
-
-        # Create account and wait for registration
-        acc = lib.create_account(acc_cfg, cb=AccountCallback())
-        print("Waiting for registration...")
-        time.sleep(3)
-
-        # Make the call
-        try:
-            uri = f"sip:{phone.number}@nyc.us.out.didww.com"
-            print(f"Dialing: {uri}")
-            call = acc.make_call(uri, cb=CallCallback())
-            
-            # Получаем максимальную длительность звонка из настроек (по умолчанию 60 секунд)
-            Settings = get_settings_model()
-            max_call_duration = int(Settings.get_value('max_call_duration', '60'))
-            start_time = time.time()
-            
-            # Ждем завершения звонка с учетом максимальной длительности
-            time.sleep(2)  # Даем время на установление соединения
-            while (call and call.is_valid() and 
-                   call.info().state != pj.CallState.DISCONNECTED and 
-                   time.time() - start_time < max_call_duration):
-                time.sleep(0.5)
-            
-            # Если звонок все еще активен после достижения максимальной длительности
-            if (call and call.is_valid() and 
-                call.info().state != pj.CallState.DISCONNECTED):
-                try:
-                    print(f"Call exceeded maximum duration of {max_call_duration}s, hanging up: {phone.number}")
-                    call.hangup()
-                except pj.Error as e:
-                    print(f"Error hanging up call: {str(e)}")
-            else:
-                print(f"Call ended normally: {phone.number}")
-
-        except pj.Error as e:
-            print(f"Error making call to {phone.number}: {str(e)}")
-
-        # Update phone record
-        phone.last_called_at = timezone.now()
-        phone.save()
-
-        # Check for new recordings
-        check_recordings.delay(phone_id)
-
+        dial_phone(get_phone_number_model().objects.get(id=phone_id))
     except Exception as e:
         print(f"Error processing phone {phone_id}: {str(e)}")
-    finally:
-        if lib:
-            try:
-                print("Destroying library...")
-                lib.destroy()
-            except Exception as e:
-                print(f"Error destroying library: {str(e)}")
+
+def dial_phone(phone, priority=QUEUE_PRIORITY_DEFAULT):
+    """
+    Проверяет лимит попыток и ставит номер в очередь дозвонщика.
+    Ошибки (например, недоступный Redis) не перехватываются.
+    """
+    print(f"Processing phone number: {phone.number}")
+    if phone.call_attempts >= 15:
+        print(f"Skipping call to {phone.number} - maximum attempts (15) reached")
+        return False
+
+    enqueue_dial(phone.id, priority)
+    return True
 
 @shared_task
 def check_recordings(phone_id):
-    """Check for new recordings and process them"""
+    """Check a phone's recordings directory for files that were not ingested yet"""
     try:
         phone = get_phone_number_model().objects.get(id=phone_id)
-        recordings_dir = os.path.join("recordings", phone.number)
+        recordings_dir = os.path.join(settings.RECORDINGS_DIR, phone.number)
         
         if os.path.exists(recordings_dir):
             # Get all wav files that haven't been processed
@@ -242,79 +95,254 @@ def check_recordings(phone_id):
                 phone_number=phone
             ).values_list('audio_file', flat=True))
             
-            all_files = set(glob.glob(os.path.join(recordings_dir, "*.wav")))
-            new_files = all_files - processed_files
-            
-            # Initialize speech recognition
-            recognizer = sr.Recognizer()
-            
-            for audio_file in new_files:
-                # Create call record
-                call_record = get_call_record_model().objects.create(
-                    phone_number=phone,
-                    audio_file=audio_file
-                )
-                
-                # Transcribe audio using Google Speech Recognition
-                try:
-                    with sr.AudioFile(audio_file) as source:
-                        audio = recognizer.record(source)
-                    transcript = recognizer.recognize_google(audio)
-                    
-                    # Save transcript
-                    call_record.transcript = transcript
-                    call_record.save()
-                    
-                    # Generate summary
-                    generate_summary.delay(phone.id)
-                except sr.UnknownValueError:
-                    print(f"Google Speech Recognition could not understand the audio: {audio_file}")
-                    call_record.transcript = "Audio could not be transcribed"
-                    call_record.save()
-                except sr.RequestError as e:
-                    print(f"Could not request results from Google Speech Recognition service; {str(e)}")
-                    call_record.transcript = "Error during transcription"
-                    call_record.save()
+            for audio_file in glob.glob(os.path.join(recordings_dir, "*.wav")):
+                if recording_relative_path(audio_file) not in processed_files:
+                    ingest_recording(audio_file)
                 
     except Exception as e:
         print(f"Error checking recordings for phone {phone_id}: {str(e)}")
 
+@shared_task
+def reconcile_recordings():
+    """
+    Страховочная сверка каталога записей на случай пропущенных событий
+    файловой системы. Просматриваются только недавно измененные каталоги.
+    """
+    try:
+        max_age_minutes = int(get_settings_model().get_value('recordings_reconcile_window_minutes', '60'))
+        ingested = ingest_missing_recordings(max_age_minutes * 60)
+        if ingested:
+            print(f"Reconciliation ingested {ingested} missed recordings")
+    except Exception as e:
+        print(f"Error in reconcile_recordings: {str(e)}")
+
+def lock_record_for_transcription(record_id):
+    """Не дает двум воркерам расшифровывать одну и ту же запись"""
+    return get_redis().set(TRANSCRIBE_LOCK_KEY.format(record_id), 1, nx=True, ex=TRANSCRIBE_LOCK_TTL)
+
+@shared_task
+def transcribe_call_record(record_id):
+    """
+    Transcribe a call recording and request a summary.
+    If the backend supports batching (local Whisper), other recordings waiting
+    for transcription are picked up into the same batch (up to
+    transcription_batch_size), so the model handles them in one inference pass.
+    """
+    try:
+        CallRecord = get_call_record_model()
+        if not lock_record_for_transcription(record_id):
+            return
+
+        record_ids = [record_id]
+        # Пачку собираем, только если бэкенд расшифровывает ее за один проход;
+        # иначе записи остаются свободными для других воркеров
+        batch_size = int(get_settings_model().get_value('transcription_batch_size', '8'))
+        if batch_size > 1 and get_backend().supports_batch:
+            pending_ids = pending_transcriptions().filter(
+                created_at__gte=timezone.now() - timezone.timedelta(hours=1)
+            ).exclude(
+                id=record_id
+            ).values_list('id', flat=True)[:batch_size * 2]
+
+            for pending_id in pending_ids:
+                if len(record_ids) >= batch_size:
+                    break
+                if lock_record_for_transcription(pending_id):
+                    record_ids.append(pending_id)
+
+        try:
+            transcribe_records(CallRecord.objects.filter(id__in=record_ids, transcript=''))
+        finally:
+            get_redis().delete(*[TRANSCRIBE_LOCK_KEY.format(pending_id) for pending_id in record_ids])
+
+    except Exception as e:
+        print(f"Error transcribing call record {record_id}: {str(e)}")
+
+def pending_transcriptions():
+    """Записи с аудиофайлом, которые еще ждут расшифровки, старые первыми"""
+    return get_call_record_model().objects.filter(
+        transcript=''
+    ).exclude(audio_file='').exclude(audio_file__isnull=True).order_by('created_at')
+
+def transcribe_records(call_records, language='en-US'):
+    """Расшифровывает записи одним вызовом бэкенда и запрашивает summary"""
+    from .models import TRANSCRIPT_UNRECOGNIZED, TRANSCRIPT_ERROR
+
+    items = []
+    for record in call_records:
+        path = record.get_audio_file_path()
+        if path:
+            items.append((record, path))
+        else:
+            # Без файла запись так и осталась бы в ожидании расшифровки
+            record.transcript = TRANSCRIPT_ERROR
+            record.transcribed_at = timezone.now()
+            record.save()
+    if not items:
+        return
+
+    results = get_backend().transcribe_batch([path for _, path in items], language=language)
+
+    phone_ids = set()
+    for (call_record, audio_file), result in zip(items, results):
+        if isinstance(result, sr.UnknownValueError):
+            print(f"Speech recognition could not understand the audio: {audio_file}")
+            call_record.transcript = TRANSCRIPT_UNRECOGNIZED
+        elif isinstance(result, Exception):
+            print(f"Could not transcribe {audio_file}; {str(result)}")
+            call_record.transcript = TRANSCRIPT_ERROR
+        else:
+            call_record.transcript = result
+            phone_ids.add(call_record.phone_number_id)
+        call_record.transcribed_at = timezone.now()
+        call_record.save()
+
+    # Generate summary
+    for phone_id in phone_ids:
+        request_summary(phone_id)
+
+def request_summary(phone_id):
+    """
+    Запрашивает генерацию summary для номера с задержкой summary_debounce_seconds.
+    Все запросы по номеру, пришедшие до запуска, схлопываются в одну генерацию
+    по самому свежему набору транскрипций.
+    """
+    debounce = int(get_settings_model().get_value('summary_debounce_seconds', '30'))
+    try:
+        scheduled = get_redis().set(
+            SUMMARY_PENDING_KEY.format(phone_id), 1,
+            nx=True, ex=debounce + SUMMARY_PENDING_GRACE
+        )
+    except Exception as e:
+        print(f"Error debouncing summary for phone {phone_id}: {str(e)}")
+        scheduled = True
+    if scheduled:
+        generate_summary.apply_async((phone_id,), countdown=debounce)
+
+def collect_summary_input(phone, incremental, cutoff):
+    """
+    Собирает транскрипции для summary, без пустых и неудачных.
+    В инкрементальном режиме при наличии summary берет только транскрипции,
+    появившиеся после summary_updated_at, и возвращает прежнее summary.
+    Возвращает (прежнее summary или None, список транскрипций).
+    """
+    from .models import FAILED_TRANSCRIPTS
+
+    records = get_call_record_model().objects.filter(
+        phone_number=phone
+    ).exclude(transcript='').exclude(transcript__in=FAILED_TRANSCRIPTS)
+
+    previous_summary = None
+    if incremental and phone.summary and phone.summary_updated_at:
+        previous_summary = phone.summary
+        records = records.filter(
+            transcribed_at__gt=phone.summary_updated_at,
+            transcribed_at__lte=cutoff
+        )
+
+    transcripts = list(records.order_by('created_at', 'id').values_list('transcript', flat=True))
+    return previous_summary, transcripts
+
+def build_summary_messages(previous_summary, transcripts):
+    combined_text = " ".join(transcripts)
+    if previous_summary:
+        content = (
+            f"{settings.SUMMARY_PROMPT}\n\nExisting mapping:\n[START MAPPING]\n{previous_summary}\n[END MAPPING]\n\n"
+            f"New text to analyze:\n[START TEXT]\n{combined_text}\n[END TEXT]\n\n"
+            "Please update the existing mapping with all possible paths from the new text, keeping the existing paths "
+            "and strictly following the specified format."
+        )
+    else:
+        content = (
+            f"{settings.SUMMARY_PROMPT}\n\nText to analyze:\n[START TEXT]\n{combined_text}\n[END TEXT]\n\n"
+            "Please analyze the above text and create a mapping with all possible paths, strictly following the specified format."
+        )
+    return [{"role": "user", "content": content}]
+
+def summary_cache_key(model, messages):
+    payload = json.dumps({'model': model, 'messages': messages}, sort_keys=True, ensure_ascii=False)
+    return SUMMARY_CACHE_KEY.format(hashlib.sha256(payload.encode('utf-8')).hexdigest())
+
+def get_cached_summary(messages):
+    try:
+        return get_redis().get(summary_cache_key(SUMMARY_MODEL, messages))
+    except Exception as e:
+        print(f"Error reading summary cache: {str(e)}")
+        return None
+
+def cache_summary(messages, summary):
+    try:
+        get_redis().set(summary_cache_key(SUMMARY_MODEL, messages), summary, ex=SUMMARY_CACHE_TTL)
+    except Exception as e:
+        print(f"Error writing summary cache: {str(e)}")
+
+def create_summary(messages):
+    """
+    Возвращает ответ модели на messages. Одинаковый вход (те же транскрипции,
+    промпт и модель) отдается из кэша в Redis без обращения к OpenAI.
+    """
+    summary = get_cached_summary(messages)
+    if summary is None:
+        summary = chat_completion(messages, model=SUMMARY_MODEL, **SUMMARY_OPTIONS)
+        cache_summary(messages, summary)
+    return summary
+
+def create_summaries(messages_list, concurrency):
+    """
+    Пакетный вариант create_summary: промахи кэша запрашиваются у OpenAI
+    параллельно. Для каждого входа возвращает summary или исключение.
+    """
+    results = [get_cached_summary(messages) for messages in messages_list]
+    missing = [index for index, summary in enumerate(results) if summary is None]
+    responses = chat_completion_batch(
+        [messages_list[index] for index in missing],
+        concurrency=concurrency,
+        model=SUMMARY_MODEL,
+        **SUMMARY_OPTIONS
+    )
+    for index, response in zip(missing, responses):
+        if not isinstance(response, Exception):
+            cache_summary(messages_list[index], response)
+        results[index] = response
+    return results
+
+def prepare_summary(phone):
+    """
+    Готовит запрос summary для номера. Возвращает (cutoff, messages)
+    или None, если суммировать нечего.
+    """
+    # Collect transcripts: only new ones on top of the previous summary in incremental mode
+    incremental = get_settings_model().get_value('summary_incremental', '1') == '1'
+    cutoff = timezone.now()
+    previous_summary, transcripts = collect_summary_input(phone, incremental, cutoff)
+    if not transcripts:
+        return None
+    return cutoff, build_summary_messages(previous_summary, transcripts)
+
+def save_summary(phone, summary, cutoff):
+    phone.summary = summary
+    # Транскрипции, появившиеся во время генерации, войдут в следующее обновление
+    phone.summary_updated_at = cutoff
+    # Проверяем наличие в очереди перед сохранением
+    if not get_call_queue_model().objects.filter(phone_number=phone).exists():
+        phone.status = 'completed'
+    phone.save()
+
 @shared_task
 def generate_summary(phone_id):
     try:
+        # Запросы, пришедшие после этого момента, запланируют новую генерацию
+        get_redis().delete(SUMMARY_PENDING_KEY.format(phone_id))
         phone = get_phone_number_model().objects.get(id=phone_id)
         
-        # Collect all transcripts
-        transcripts = get_call_record_model().objects.filter(phone_number=phone).values_list('transcript', flat=True)
-        combined_text = " ".join(transcripts)
+        prepared = prepare_summary(phone)
+        if prepared is None:
+            print(f"No new transcripts to summarize for phone {phone.number}")
+            return
+        cutoff, messages = prepared
         
         # Generate summary using OpenAI
-        messages = [
-            {
-                "role": "user",
-                "content": (
-                    f"{settings.SUMMARY_PROMPT}\n\nText to analyze:\n[START TEXT]\n{combined_text}\n[END TEXT]\n\n"
-                    "Please analyze the above text and create a mapping with all possible paths, strictly following the specified format."
-                )
-            },
-        ]
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0,
-            max_tokens=2048
-        )
-        
-        summary = response.choices[0].message['content'].strip()
-        
-        # Update phone record
-        phone.summary = summary
-        phone.summary_updated_at = timezone.now()
-        # Проверяем наличие в очереди перед сохранением
-        if not get_call_queue_model().objects.filter(phone_number=phone).exists():
-            phone.status = 'completed'
-        phone.save()
+        save_summary(phone, create_summary(messages), cutoff)
         
     except Exception as e:
         print(f"Error generating summary for phone {phone_id}: {str(e)}")
@@ -322,62 +350,55 @@ def generate_summary(phone_id):
 @shared_task
 def schedule_recall():
     recall_interval = int(get_settings_model().get_value('recall_interval_hours', '24'))
-    cutoff_time = timezone.now() - timezone.timedelta(hours=recall_interval)
     
-    phones_to_recall = get_phone_number_model().objects.filter(
+    for phone in phones_to_recall(recall_interval):
+        process_phone_number.delay(phone.id)
+
+def phones_to_recall(recall_interval):
+    """Номера, которым не звонили дольше recall_interval часов или не звонили вовсе"""
+    cutoff_time = timezone.now() - timezone.timedelta(hours=recall_interval)
+    return get_phone_number_model().objects.filter(
         models.Q(last_called_at__lte=cutoff_time) | 
         models.Q(last_called_at__isnull=True)
     )
-    
-    for phone in phones_to_recall:
-        process_phone_number.delay(phone.id)
 
 @shared_task
 def process_unprocessed_recordings():
+    """
+    Страховочная проверка: записи, которые дольше recordings_check_interval
+    минут ждут расшифровки (задача transcribe_call_record потерялась или
+    упала), снова отправляются на расшифровку
+    """
     try:
-        CallRecord = get_call_record_model()
         check_interval = int(get_settings_model().get_value('recordings_check_interval', '5'))
-        
-        unprocessed_records = CallRecord.objects.filter(
-            transcript__isnull=True,
-            audio_file__isnull=False,
-            created_at__lte=timezone.now() - timezone.timedelta(minutes=check_interval)
-        )
-
-        for record in unprocessed_records:
-            try:
-                # Расшифровываем аудио
-                transcript = transcribe_audio(record.get_audio_file_path())
-                
-                if transcript:
-                    # Сохраняем расшифровку
-                    record.transcript = transcript
-                    record.save()
 
-                    # Проверяем статус всех транскрипций
-                    record.phone_number.check_transcription_status()
+        record_ids = list(unprocessed_recordings(check_interval).values_list(
+            'id', flat=True
+        )[:TRANSCRIBE_SWEEP_BATCH_SIZE])
 
-                    # Генерируем summary только если хотя бы одна транскрипция успешна
-                    if transcript != "Audio could not be transcribed":
-                        generate_summary.delay(record.phone_number.id)
+        # Запись, которую уже расшифровывают, задача пропустит по блокировке
+        for record_id in record_ids:
+            transcribe_call_record.delay(record_id)
 
-            except Exception as e:
-                print(f"Ошибка при расшифровке записи {record.id}: {str(e)}")
+        if record_ids:
+            print(f"Отправлено на повторную расшифровку записей: {len(record_ids)}")
 
     except Exception as e:
         print(f"Ошибка в process_unprocessed_recordings: {str(e)}")
 
+def unprocessed_recordings(check_interval):
+    """Записи, ожидающие расшифровки дольше check_interval минут"""
+    return pending_transcriptions().filter(
+        created_at__lte=timezone.now() - timezone.timedelta(minutes=check_interval)
+    )
+
 def transcribe_audio(audio_file_path):
     """
-    Транскрибация аудиофайла с использованием speech_recognition
+    Транскрибация аудиофайла выбранным в настройках бэкендом
     """
     try:
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(audio_file_path) as source:
-            audio = recognizer.record(source)
-        
         # Распознавание речи с русским языком
-        transcript = recognizer.recognize_google(audio, language='ru-RU')
+        transcript = get_backend().transcribe(audio_file_path, language='ru-RU')
         return transcript
     except Exception as e:
         print(f"Ошибка при транскрибации {audio_file_path}: {str(e)}")
@@ -386,45 +407,27 @@ def transcribe_audio(audio_file_path):
 @shared_task
 def process_call_queue():
     """
-    Периодическая задача для обработки очереди звонков.
-    Берет первый номер из очереди и инициирует звонок.
+    Обработка очереди звонков.
+    Запускается сразу при добавлении номера в очередь и при освобождении
+    канала дозвонщика, а периодически - только как страховочная проверка.
+    Забирает из очереди столько номеров, сколько сейчас свободных каналов
+    у дозвонщиков, и передает их на звонок.
     """
-    # Получаем первый номер из очереди
-    queue_item = get_call_queue_model().objects.first()
-    if queue_item:
+    CallQueue = get_call_queue_model()
+    clear_call_queue_notification()
+
+    free_slots = free_dial_slots()
+    if free_slots <= 0:
+        return
+
+    for phone, priority in CallQueue.claim(free_slots):
         try:
-            # Получаем номер телефона
-            phone = queue_item.phone_number
-            
-            # Проверяем, не обрабатывается ли уже этот номер
-            if phone.status == 'in_progress':
-                print(f"Phone {phone.number} is already being processed, skipping")
-                return
-            
-            # Удаляем запись из очереди
-            queue_id = queue_item.id
-            queue_item.delete()
-            
-            try:
-                # Инициируем звонок
-                phone.status = 'in_progress'
-                phone.save()
-                
-                # Запускаем существующую логику звонка
-                process_phone_number.delay(phone.id)
-                
-            except Exception as e:
-                print(f"Error processing phone {phone.number}: {str(e)}")
-                # В случае ошибки возвращаем номер в очередь
-                phone.status = 'pending'
-                phone.save()
-                CallQueue.objects.create(
-                    phone_number=phone,
-                    priority=queue_item.priority
-                )
-            
+            # Без перехвата ошибок внутри, чтобы неудача вернула номер в очередь
+            dial_phone(phone, priority)
         except Exception as e:
-            print(f"Error processing queue item {queue_item.id}: {str(e)}")
+            logger.error(f"Error processing phone {phone.number}: {str(e)}")
+            # В случае ошибки возвращаем номер в очередь с прежним приоритетом
+            phone.add_to_queue(priority=priority)
 
 @shared_task
 def process_missing_summaries():
@@ -433,28 +436,64 @@ def process_missing_summaries():
     у которых есть расшифрованные записи, но нет саммари
     """
     try:
-        PhoneNumber = get_phone_number_model()
-        CallRecord = get_call_record_model()
         Settings = get_settings_model()
 
-        # Получаем интервал проверки из настроек, по умолчанию 5 минут
-        check_interval = int(Settings.get_value('missing_summaries_check_interval', '5'))
-        
-        # Находим номера без саммари, но с расшифрованными записями
-        numbers_without_summary = PhoneNumber.objects.filter(
-            summary__isnull=True,  # нет саммари
-            call_records__transcript__isnull=False  # есть расшифрованные записи
-        ).distinct()  # убираем дубликаты
-
-        for phone_number in numbers_without_summary:
-            try:
-                # Запускаем генерацию саммари
-                generate_summary.delay(phone_number.id)
-            except Exception as e:
-                print(f"Ошибка при генерации Summary для номера {phone_number.number}: {str(e)}")
+        # Проходы не должны пересекаться: иначе одни и те же номера суммируются дважды
+        redis_client = get_redis()
+        lock_token = uuid.uuid4().hex
+        if not redis_client.set(SUMMARY_SWEEP_LOCK_KEY, lock_token, nx=True, ex=SUMMARY_SWEEP_LOCK_TTL):
+            logger.info("process_missing_summaries is already running, skipping")
+            return
+        try:
+            summarize_missing(Settings, redis_client)
+        finally:
+            if redis_client.get(SUMMARY_SWEEP_LOCK_KEY) == lock_token:
+                redis_client.delete(SUMMARY_SWEEP_LOCK_KEY)
 
     except Exception as e:
-        print(f"Ошибка в process_missing_summaries: {str(e)}")
+        logger.error(f"Ошибка в process_missing_summaries: {str(e)}")
+
+def phones_missing_summary():
+    """Номера без summary, у которых есть хотя бы одна удачная транскрипция"""
+    from .models import FAILED_TRANSCRIPTS
+
+    valid_records = get_call_record_model().objects.filter(
+        phone_number=models.OuterRef('pk')
+    ).exclude(transcript='').exclude(transcript__in=FAILED_TRANSCRIPTS)
+    return get_phone_number_model().objects.filter(summary__isnull=True).filter(models.Exists(valid_records))
+
+def summarize_missing(Settings, redis_client):
+    """Один проход process_missing_summaries, не больше SUMMARY_SWEEP_BATCH_SIZE номеров"""
+    candidates = list(phones_missing_summary().order_by('id')[:SUMMARY_SWEEP_BATCH_SIZE * 2])
+    if not candidates:
+        return
+
+    # Номера, для которых уже запланирован generate_summary, оставляем ему
+    pending = redis_client.mget([SUMMARY_PENDING_KEY.format(phone.id) for phone in candidates])
+    numbers_without_summary = [
+        phone for phone, is_pending in zip(candidates, pending) if not is_pending
+    ][:SUMMARY_SWEEP_BATCH_SIZE]
+
+    # Суммируем пачкой: запросы к OpenAI идут параллельно внутри этого воркера
+    concurrency = int(Settings.get_value('llm_concurrency', str(DEFAULT_CONCURRENCY)))
+    prepared = []
+    for phone_number in numbers_without_summary:
+        try:
+            summary_input = prepare_summary(phone_number)
+            if summary_input is not None:
+                prepared.append((phone_number, summary_input))
+        except Exception as e:
+            logger.error(f"Ошибка при подготовке Summary для номера {phone_number.number}: {str(e)}")
+
+    summaries = create_summaries([messages for _, (_, messages) in prepared], concurrency)
+    for (phone_number, (cutoff, _)), summary in zip(prepared, summaries):
+        if isinstance(summary, Exception):
+            logger.error(f"Ошибка при генерации Summary для номера {phone_number.number}: {str(summary)}")
+            continue
+        try:
+            save_summary(phone_number, summary, cutoff)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении Summary для номера {phone_number.number}: {str(e)}")
 
 @shared_task
 def check_stuck_calls():
@@ -464,20 +503,12 @@ def check_stuck_calls():
     дольше максимального времени звонка.
     """
     try:
-        PhoneNumber = get_phone_number_model()
         Settings = get_settings_model()
         
         # Получаем максимальную длительность звонка из настроек
         max_call_duration = int(Settings.get_value('max_call_duration', '60'))
         
-        # Находим все номера, которые "зависли" в статусе in_progress
-        stuck_time = timezone.now() - timezone.timedelta(seconds=max_call_duration * 2)
-        stuck_calls = PhoneNumber.objects.filter(
-            status='in_progress',
-            updated_at__lte=stuck_time
-        )
-        
-        for phone in stuck_calls:
+        for phone in stuck_calls(max_call_duration):
             try:
                 print(f"Recovering stuck call for number: {phone.number}")
                 # Возвращаем номер в очередь
@@ -490,6 +521,14 @@ def check_stuck_calls():
     except Exception as e:
         print(f"Error in check_stuck_calls: {str(e)}")
 
+def stuck_calls(max_call_duration):
+    """Номера, которые "зависли" в статусе in_progress"""
+    stuck_time = timezone.now() - timezone.timedelta(seconds=stuck_call_timeout(max_call_duration))
+    return get_phone_number_model().objects.filter(
+        status='in_progress',
+        updated_at__lte=stuck_time
+    )
+
 @shared_task
 def check_completed_status():
     """
@@ -499,39 +538,31 @@ def check_completed_status():
     3. Номер не в очереди
     """
     try:
-        PhoneNumber = get_phone_number_model()
-        CallQueue = get_call_queue_model()
+        # Все условия проверяются одним UPDATE, без обхода номеров в Python
+        updated = phones_to_complete().update(status='completed', updated_at=timezone.now())
         
-        # Получаем все номера, у которых есть summary
-        phones = PhoneNumber.objects.filter(summary__isnull=False).exclude(status='completed')
-        
-        for phone in phones:
-            try:
-                # Проверяем наличие в очереди
-                if CallQueue.objects.filter(phone_number=phone).exists():
-                    continue
-                
-                # Проверяем все записи
-                call_records = phone.call_records.all()
-                if not call_records.exists():
-                    continue
-                    
-                # Проверяем, что у всех записей есть транскрипция
-                if call_records.filter(transcript__isnull=True).exists() or \
-                   call_records.filter(transcript='').exists():
-                    continue
-                
-                # Если все условия выполнены, устанавливаем статус "Готово"
-                phone.status = 'completed'
-                phone.save()
-                print(f"Номер {phone.number} помечен как готовый")
-                
-            except Exception as e:
-                print(f"Ошибка при обработке номера {phone.number}: {str(e)}")
+        if updated:
+            print(f"Помечено как готовые номеров: {updated}")
                 
     except Exception as e:
         print(f"Ошибка в check_completed_status: {str(e)}")
 
+def phones_to_complete():
+    """Номера с summary, не в очереди, у которых все записи расшифрованы"""
+    records = get_call_record_model().objects.filter(phone_number=models.OuterRef('pk'))
+    return get_phone_number_model().objects.filter(
+        summary__isnull=False
+    ).exclude(
+        status='completed'
+    ).filter(
+        # Номер не в очереди
+        ~models.Exists(get_call_queue_model().objects.filter(phone_number=models.OuterRef('pk'))),
+        # Есть записи
+        models.Exists(records),
+        # У всех записей есть транскрипция
+        ~models.Exists(records.filter(transcript=''))
+    )
+
 @shared_task
 def check_failed_transcriptions():
     """
@@ -539,11 +570,11 @@ def check_failed_transcriptions():
     с неудачными транскрипциями
     """
     try:
-        PhoneNumber = get_phone_number_model()
-        phones = PhoneNumber.objects.exclude(status='failed')
-        
-        for phone in phones:
-            phone.check_transcription_status()
+        # Основной путь - проверка при записи транскрипции (signals.py),
+        # здесь догоняем номера, у которых записи удалялись или менялись вручную
+        updated = get_phone_number_model().mark_failed_transcriptions()
+        if updated:
+            print(f"Помечено как неудачные номеров: {updated}")
             
     except Exception as e:
         print(f"Ошибка в check_failed_transcriptions: {str(e)}")
@@ -553,7 +584,7 @@ def check_failed_transcriptions():
 app.conf.beat_schedule.update({
     'process-call-queue': {
         'task': 'phone_numbers.tasks.process_call_queue',
-        'schedule': 20.0,  # каждые 20 секунд
+        'schedule': 60.0,  # страховочная проверка, основной запуск - по событию
     },
     'process-missing-summaries': {
         'task': 'phone_numbers.tasks.process_missing_summaries',
@@ -567,6 +598,10 @@ app.conf.beat_schedule.update({
         'task': 'phone_numbers.tasks.check_completed_status',
         'schedule': 60.0,  # Запускать каждую минуту
     },
+    'reconcile-recordings': {
+        'task': 'phone_numbers.tasks.reconcile_recordings',
+        'schedule': 300.0,  # каждые 5 минут, основной путь - watch_recordings
+    },
     'check-failed-transcriptions': {
         'task': 'phone_numbers.tasks.check_failed_transcriptions',
         'schedule': 300.0,  # каждые 5 минут
@@ -0,0 +1,325 @@
+import threading
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+
+from .dial_queue import QUEUE_PRIORITY_MANUAL
+from .models import PhoneNumber, CallRecord, CallQueue, Settings, SETTINGS_VERSION_KEY, TRANSCRIPT_UNRECOGNIZED
+from .phone_parsing import extract_phone_numbers, iter_number_batches, UnparsedLines
+
+
+class ExtractPhoneNumbersTests(SimpleTestCase):
+    def test_space_separated(self):
+        self.assertEqual(
+            extract_phone_numbers('79991234567 78889999999'),
+            ['79991234567', '78889999999']
+        )
+
+    def test_tab_separated(self):
+        self.assertEqual(
+            extract_phone_numbers('79991234567\t78889999999'),
+            ['79991234567', '78889999999']
+        )
+
+    def test_comma_separated(self):
+        self.assertEqual(
+            extract_phone_numbers('79991234567, 78889999999'),
+            ['79991234567', '78889999999']
+        )
+
+    def test_formatted_numbers(self):
+        self.assertEqual(
+            extract_phone_numbers('John;+7 (999) 123-45-67;8 888 999 99 99'),
+            ['79991234567', '88889999999']
+        )
+
+    def test_grouped_numbers_separated_by_space(self):
+        self.assertEqual(
+            extract_phone_numbers('+7 999 123 45 67 8 888 999 99 99'),
+            ['79991234567', '88889999999']
+        )
+
+    def test_too_short(self):
+        self.assertEqual(extract_phone_numbers('ext 12345'), [])
+
+
+class IterNumberBatchesTests(SimpleTestCase):
+    def test_batches_deduplicate_and_collect_unparsed(self):
+        unparsed = UnparsedLines(limit=1)
+        lines = ['79991234567 78889999999', '79991234567', 'code 1234567', 'id 7654321']
+        batches = list(iter_number_batches(lines, 1, unparsed))
+        self.assertEqual(batches, [['79991234567'], ['78889999999']])
+        self.assertEqual(unparsed.lines, ['code 1234567'])
+        self.assertEqual(unparsed.count, 2)
+
+
+def queue_phone(number, priority=0, minutes_ago=0):
+    phone = PhoneNumber.objects.create(number=number)
+    item = CallQueue.objects.create(phone_number=phone, priority=priority)
+    # created_at задает порядок внутри одного приоритета
+    CallQueue.objects.filter(pk=item.pk).update(created_at=timezone.now() - timezone.timedelta(minutes=minutes_ago))
+    return phone
+
+
+class CallQueueClaimTests(TestCase):
+    def test_claims_by_priority_then_age(self):
+        old = queue_phone('79990000001', minutes_ago=10)
+        new = queue_phone('79990000002', minutes_ago=1)
+        manual = queue_phone('79990000003', priority=QUEUE_PRIORITY_MANUAL)
+
+        claimed = CallQueue.claim(2)
+
+        self.assertEqual(
+            [(phone.number, priority) for phone, priority in claimed],
+            [(manual.number, QUEUE_PRIORITY_MANUAL), (old.number, 0)]
+        )
+        self.assertEqual(list(CallQueue.objects.values_list('phone_number', flat=True)), [new.id])
+        self.assertEqual(
+            dict(PhoneNumber.objects.values_list('number', 'status')),
+            {old.number: 'in_progress', new.number: 'pending', manual.number: 'in_progress'}
+        )
+        self.assertTrue(all(phone.status == 'in_progress' for phone, _ in claimed))
+
+    def test_skips_numbers_already_in_progress(self):
+        busy = queue_phone('79990000001', priority=QUEUE_PRIORITY_MANUAL)
+        PhoneNumber.objects.filter(pk=busy.pk).update(status='in_progress')
+        idle = queue_phone('79990000002')
+
+        self.assertEqual([phone.id for phone, _ in CallQueue.claim(5)], [idle.id])
+        self.assertTrue(CallQueue.objects.filter(phone_number=busy).exists())
+
+    def test_nothing_to_claim(self):
+        queue_phone('79990000001')
+        self.assertEqual(CallQueue.claim(0), [])
+        CallQueue.claim(1)
+        self.assertEqual(CallQueue.claim(1), [])
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class CallQueueSkipLockedTests(TransactionTestCase):
+    def test_row_locked_by_another_worker_is_skipped(self):
+        locked = queue_phone('79990000001', priority=QUEUE_PRIORITY_MANUAL)
+        free = queue_phone('79990000002')
+        row_locked = threading.Event()
+        release = threading.Event()
+
+        def other_worker():
+            try:
+                with transaction.atomic():
+                    list(CallQueue.objects.select_for_update().filter(phone_number=locked))
+                    row_locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        try:
+            self.assertTrue(row_locked.wait(10))
+            claimed = CallQueue.claim(5)
+        finally:
+            release.set()
+            worker.join()
+
+        self.assertEqual([phone.id for phone, _ in claimed], [free.id])
+        self.assertEqual(PhoneNumber.objects.get(pk=locked.pk).status, 'pending')
+        self.assertEqual(PhoneNumber.objects.get(pk=free.pk).status, 'in_progress')
+        self.assertTrue(CallQueue.objects.filter(phone_number=locked).exists())
+
+
+class MarkFailedTranscriptionsTests(TestCase):
+    def make_phone(self, number, transcripts):
+        phone = PhoneNumber.objects.create(number=number)
+        for transcript in transcripts[1:]:
+            CallRecord.objects.create(phone_number=phone)
+        # update() в обход сигнала: проверяем сам проход, а не проверку при записи
+        for record, transcript in zip(phone.call_records.order_by('id'), transcripts):
+            CallRecord.objects.filter(pk=record.pk).update(transcript=transcript)
+        return phone
+
+    def statuses(self):
+        return dict(PhoneNumber.objects.values_list('number', 'status'))
+
+    def test_only_numbers_with_all_records_unrecognized(self):
+        self.make_phone('79990000001', [TRANSCRIPT_UNRECOGNIZED, TRANSCRIPT_UNRECOGNIZED])
+        self.make_phone('79990000002', [TRANSCRIPT_UNRECOGNIZED, 'hello'])
+        self.make_phone('79990000003', [TRANSCRIPT_UNRECOGNIZED, ''])
+
+        self.assertEqual(PhoneNumber.mark_failed_transcriptions(), 1)
+        self.assertEqual(self.statuses(), {
+            '79990000001': 'failed', '79990000002': 'pending', '79990000003': 'pending'
+        })
+        # Уже помеченные номера повторно не обновляются
+        self.assertEqual(PhoneNumber.mark_failed_transcriptions(), 0)
+
+    def test_phone_ids_limit_the_check(self):
+        first = self.make_phone('79990000001', [TRANSCRIPT_UNRECOGNIZED])
+        self.make_phone('79990000002', [TRANSCRIPT_UNRECOGNIZED])
+
+        self.assertEqual(PhoneNumber.mark_failed_transcriptions(phone_ids=[first.id]), 1)
+        self.assertEqual(self.statuses(), {'79990000001': 'failed', '79990000002': 'pending'})
+
+    def test_completed_number_with_summary_is_kept(self):
+        done = self.make_phone('79990000001', [TRANSCRIPT_UNRECOGNIZED])
+        PhoneNumber.objects.filter(pk=done.pk).update(summary='summary', status='completed')
+        queued = self.make_phone('79990000002', [TRANSCRIPT_UNRECOGNIZED])
+        PhoneNumber.objects.filter(pk=queued.pk).update(summary='summary')
+        CallQueue.objects.create(phone_number=queued)
+
+        self.assertEqual(PhoneNumber.mark_failed_transcriptions(), 1)
+        self.assertEqual(self.statuses(), {'79990000001': 'completed', '79990000002': 'failed'})
+
+    def test_unrecognized_transcript_is_checked_on_save(self):
+        phone = PhoneNumber.objects.create(number='79990000001')
+        record = phone.call_records.get()
+        record.transcript = TRANSCRIPT_UNRECOGNIZED
+        record.save()
+
+        self.assertEqual(PhoneNumber.objects.get(pk=phone.pk).status, 'failed')
+
+
+class CallAttemptsCounterTests(TestCase):
+    def attempts(self, phone):
+        return PhoneNumber.objects.get(pk=phone.pk).call_attempts
+
+    def test_new_number_counts_its_initial_record(self):
+        phone = PhoneNumber.objects.create(number='79990000001')
+        self.assertEqual(phone.call_records.count(), 1)
+        self.assertEqual(self.attempts(phone), 1)
+        self.assertEqual(phone.call_attempts, 1)
+
+    def test_create_and_delete_records(self):
+        phone = PhoneNumber.objects.create(number='79990000001')
+        first = CallRecord.objects.create(phone_number=phone)
+        CallRecord.objects.create(phone_number=phone)
+        self.assertEqual(self.attempts(phone), 3)
+
+        first.delete()
+        self.assertEqual(self.attempts(phone), 2)
+
+        phone.call_records.all().delete()
+        self.assertEqual(self.attempts(phone), 0)
+
+    def test_stale_instance_save_keeps_counter(self):
+        phone = PhoneNumber.objects.create(number='79990000001')
+        stale = PhoneNumber.objects.get(pk=phone.pk)
+        CallRecord.objects.create(phone_number=phone)
+
+        stale.status = 'failed'
+        stale.save()
+
+        self.assertEqual(self.attempts(phone), 2)
+        self.assertEqual(PhoneNumber.objects.get(pk=phone.pk).status, 'failed')
+
+    def test_recall_with_reset_removes_an_attempt(self):
+        phone = PhoneNumber.objects.create(number='79990000001')
+        CallRecord.objects.create(phone_number=phone)
+
+        phone.recall(reset_counter=True)
+
+        self.assertEqual(self.attempts(phone), 1)
+
+
+class SettingsCacheTests(TestCase):
+    def setUp(self):
+        Settings._cache = None
+        self.addCleanup(setattr, Settings, '_cache', None)
+        self.redis = mock.Mock()
+        self.redis.get.return_value = '1'
+        patcher = mock.patch('phone_numbers.models.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Settings.objects.update_or_create(key='max_call_duration', defaults={'value': '60'})
+
+    def expire_local_cache(self):
+        Settings._cache_checked_at = 0
+
+    def test_values_are_read_once(self):
+        self.assertEqual(Settings.get_value('max_call_duration'), '60')
+        with self.assertNumQueries(0):
+            self.assertEqual(Settings.get_value('max_call_duration'), '60')
+            self.assertEqual(Settings.get_value('missing', 'default'), 'default')
+
+    def test_save_invalidates_cache(self):
+        Settings.get_value('max_call_duration')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            setting = Settings.objects.get(key='max_call_duration')
+            setting.value = '90'
+            setting.save()
+
+        self.redis.incr.assert_called_once_with(SETTINGS_VERSION_KEY)
+        self.assertEqual(Settings.get_value('max_call_duration'), '90')
+
+    def test_reloads_when_another_process_bumps_version(self):
+        Settings.get_value('max_call_duration')
+        Settings.objects.filter(key='max_call_duration').update(value='90')
+
+        # Версия не менялась: после TTL таблица не перечитывается
+        self.expire_local_cache()
+        self.assertEqual(Settings.get_value('max_call_duration'), '60')
+
+        self.redis.get.return_value = '2'
+        self.expire_local_cache()
+        self.assertEqual(Settings.get_value('max_call_duration'), '90')
+
+    def test_reloads_without_redis(self):
+        Settings.get_value('max_call_duration')
+        Settings.objects.filter(key='max_call_duration').update(value='90')
+        self.redis.get.side_effect = ConnectionError
+
+        self.expire_local_cache()
+        self.assertEqual(Settings.get_value('max_call_duration'), '90')
+
+
+class BulkImportTests(TestCase):
+    def queue(self):
+        return dict(CallQueue.objects.values_list('phone_number__number', 'priority'))
+
+    def test_counts_new_and_repeated_numbers(self):
+        existing = PhoneNumber.objects.create(number='79990000009')
+        PhoneNumber.objects.filter(pk=existing.pk).update(status='completed')
+
+        added, repeated = PhoneNumber.bulk_import(
+            ['79990000001', '', '79990000002', '79990000001', '79990000009']
+        )
+
+        self.assertEqual((added, repeated), (2, 1))
+        self.assertEqual(self.queue(), {'79990000001': 0, '79990000002': 0, '79990000009': 0})
+        self.assertEqual(set(PhoneNumber.objects.values_list('status', flat=True)), {'pending'})
+        for phone in PhoneNumber.objects.all():
+            self.assertEqual(phone.call_records.count(), 1)
+            self.assertEqual(phone.call_attempts, 1)
+
+    def test_repeated_numbers_keep_the_higher_priority(self):
+        PhoneNumber.bulk_import(['79990000001', '79990000002'], priority=QUEUE_PRIORITY_MANUAL)
+
+        self.assertEqual(PhoneNumber.bulk_import(['79990000001', '79990000003']), (1, 1))
+        self.assertEqual(PhoneNumber.bulk_import(['79990000003'], priority=QUEUE_PRIORITY_MANUAL), (0, 1))
+        self.assertEqual(self.queue(), {
+            '79990000001': QUEUE_PRIORITY_MANUAL,
+            '79990000002': QUEUE_PRIORITY_MANUAL,
+            '79990000003': QUEUE_PRIORITY_MANUAL,
+        })
+
+    def test_number_inserted_concurrently_is_not_counted_as_new(self):
+        insert_new_numbers = PhoneNumber._insert_new_numbers.__func__
+
+        def racing_insert(cls, numbers):
+            # Другой запрос добавил номер между проверкой и вставкой
+            PhoneNumber.objects.create(number='79990000002')
+            return insert_new_numbers(cls, numbers)
+
+        with mock.patch.object(PhoneNumber, '_insert_new_numbers', classmethod(racing_insert)):
+            added, repeated = PhoneNumber.bulk_import(['79990000001', '79990000002'])
+
+        self.assertEqual((added, repeated), (1, 1))
+        raced = PhoneNumber.objects.get(number='79990000002')
+        self.assertEqual(raced.call_records.count(), 1)
+        self.assertEqual(raced.call_attempts, 1)
+        self.assertEqual(self.queue(), {'79990000001': 0, '79990000002': 0})
+
+    def test_nothing_to_import(self):
+        self.assertEqual(PhoneNumber.bulk_import(['', None]), (0, 0))
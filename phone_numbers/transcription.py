@@ -0,0 +1,217 @@
+"""
+Расшифровка записей звонков.
+
+Бэкенд выбирается настройкой transcription_backend:
+- google: WAV читается потоково окнами фиксированной длины, окна по
+  возможности режутся на паузах, каждое распознается отдельно, а текст
+  склеивается. Память не зависит от длины записи, а запросы не упираются
+  в лимит размера распознавателя.
+- whisper: локальная модель (только CPU), загружается один раз на процесс
+  воркера; короткие записи расшифровываются пачкой за один проход модели.
+"""
+import abc
+import audioop
+import wave
+
+import speech_recognition as sr
+from django.core.exceptions import ImproperlyConfigured
+
+# Шаг чтения файла и проверки на тишину
+FRAME_SECONDS = 0.5
+# Окно не короче этого режется только на паузе
+CHUNK_MIN_SECONDS = 10
+CHUNK_MAX_SECONDS = 30
+# Порог тишины как доля от максимальной амплитуды
+SILENCE_RMS_RATIO = 0.01
+
+
+def iter_audio_chunks(path, max_seconds=CHUNK_MAX_SECONDS, min_seconds=CHUNK_MIN_SECONDS):
+    """
+    Потоково читает WAV и отдает куски sr.AudioData не длиннее max_seconds.
+    Кусок закрывается раньше, если после min_seconds встретилась тишина.
+    """
+    min_seconds = min(min_seconds, max_seconds)
+    with wave.open(path, 'rb') as wav:
+        rate = wav.getframerate()
+        width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        frames_per_read = max(1, int(rate * FRAME_SECONDS))
+        bytes_per_second = rate * width
+        silence_rms = SILENCE_RMS_RATIO * (2 ** (8 * width - 1))
+
+        buffer = bytearray()
+        while True:
+            frames = wav.readframes(frames_per_read)
+            if not frames:
+                break
+            if channels == 2:
+                frames = audioop.tomono(frames, width, 0.5, 0.5)
+            buffer.extend(frames)
+
+            seconds = len(buffer) / bytes_per_second
+            is_silence = audioop.rms(frames, width) < silence_rms
+            if seconds >= max_seconds or (seconds >= min_seconds and is_silence):
+                yield sr.AudioData(bytes(buffer), rate, width)
+                buffer = bytearray()
+
+        if buffer:
+            yield sr.AudioData(bytes(buffer), rate, width)
+
+
+def transcribe_file(path, language='en-US', max_seconds=CHUNK_MAX_SECONDS):
+    """
+    Расшифровывает запись по кускам через Google Speech Recognition.
+    Куски без распознанной речи пропускаются; если не распознан ни один,
+    выбрасывается sr.UnknownValueError, как и при распознавании целиком.
+    """
+    recognizer = sr.Recognizer()
+    parts = []
+    for chunk in iter_audio_chunks(path, max_seconds=max_seconds):
+        try:
+            parts.append(recognizer.recognize_google(chunk, language=language))
+        except sr.UnknownValueError:
+            continue
+
+    if not parts:
+        raise sr.UnknownValueError()
+    return " ".join(parts)
+
+
+class TranscriptionBackend(abc.ABC):
+    """Базовый класс бэкенда расшифровки"""
+
+    # Расшифровывает ли transcribe_batch несколько записей за один проход;
+    # иначе собирать записи в пачку бессмысленно
+    supports_batch = False
+
+    @abc.abstractmethod
+    def transcribe(self, path, language='en-US'):
+        """Возвращает текст записи или выбрасывает sr.UnknownValueError / sr.RequestError"""
+
+    def transcribe_batch(self, paths, language='en-US'):
+        """
+        Расшифровывает несколько записей. Для каждой возвращает текст
+        или исключение, с которым не удалось ее расшифровать.
+        """
+        results = []
+        for path in paths:
+            try:
+                results.append(self.transcribe(path, language=language))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class GoogleBackend(TranscriptionBackend):
+    """Google Speech Recognition, запись отправляется по кускам"""
+
+    def __init__(self, chunk_seconds=CHUNK_MAX_SECONDS):
+        self.chunk_seconds = chunk_seconds
+
+    def transcribe(self, path, language='en-US'):
+        return transcribe_file(path, language=language, max_seconds=self.chunk_seconds)
+
+
+class WhisperBackend(TranscriptionBackend):
+    """Локальный Whisper на CPU, модель держится в памяти процесса"""
+
+    # Whisper декодирует окнами по 30 секунд
+    BATCH_MAX_SECONDS = 30
+    supports_batch = True
+
+    def __init__(self, model_name):
+        try:
+            import whisper
+        except ImportError:
+            raise ImproperlyConfigured(
+                "transcription_backend=whisper requires the openai-whisper and torch packages"
+            )
+        self.whisper = whisper
+        self.model_name = model_name
+        self.model = whisper.load_model(model_name, device='cpu')
+
+    def _language(self, language):
+        return language.split('-')[0] if language else None
+
+    def transcribe(self, path, language='en-US'):
+        result = self.model.transcribe(path, language=self._language(language), fp16=False)
+        text = result['text'].strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def transcribe_batch(self, paths, language='en-US'):
+        import torch
+
+        results = [None] * len(paths)
+        short = []
+        for index, path in enumerate(paths):
+            try:
+                if _wav_duration(path) <= self.BATCH_MAX_SECONDS:
+                    short.append(index)
+                    continue
+            except (wave.Error, EOFError, OSError):
+                pass
+            # Длинные записи расшифровываются по одной со скользящим окном
+            try:
+                results[index] = self.transcribe(path, language=language)
+            except Exception as e:
+                results[index] = e
+
+        # Файл, который не удалось прочитать, не должен валить всю пачку
+        loaded = []
+        mels = []
+        for index in short:
+            try:
+                mels.append(self.whisper.log_mel_spectrogram(
+                    self.whisper.pad_or_trim(self.whisper.load_audio(paths[index])),
+                    n_mels=self.model.dims.n_mels
+                ))
+                loaded.append(index)
+            except Exception as e:
+                results[index] = e
+
+        if loaded:
+            try:
+                options = self.whisper.DecodingOptions(
+                    language=self._language(language),
+                    fp16=False,
+                    without_timestamps=True
+                )
+                for index, decoded in zip(loaded, self.whisper.decode(self.model, torch.stack(mels), options)):
+                    text = decoded.text.strip()
+                    results[index] = text if text else sr.UnknownValueError()
+            except Exception as e:
+                for index in loaded:
+                    results[index] = e
+
+        return results
+
+
+def _wav_duration(path):
+    with wave.open(path, 'rb') as wav:
+        return wav.getnframes() / float(wav.getframerate())
+
+
+# Бэкенд живет весь процесс воркера, чтобы модель загружалась один раз
+_backends = {}
+
+
+def get_backend():
+    """Возвращает бэкенд расшифровки согласно настройкам"""
+    from .models import Settings
+
+    name = Settings.get_value('transcription_backend', 'google')
+    if name == 'whisper':
+        key = (name, Settings.get_value('transcription_model', 'base'))
+    else:
+        key = ('google', int(Settings.get_value('transcription_chunk_seconds', str(CHUNK_MAX_SECONDS))))
+
+    if key not in _backends:
+        # После смены настроек прежняя модель больше не нужна в памяти
+        _backends.clear()
+        if key[0] == 'whisper':
+            _backends[key] = WhisperBackend(key[1])
+        else:
+            _backends[key] = GoogleBackend(chunk_seconds=key[1])
+    return _backends[key]
@@ -3,24 +3,89 @@ from django.views.generic import ListView, UpdateView, CreateView
 from django.urls import reverse_lazy, reverse
 from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
-from django.db import IntegrityError, transaction
-from .models import PhoneNumber, Settings, CallRecord, CallQueue
+from django.db import transaction
+from django.db.models import Count, Q
+from urllib.parse import urlencode
+from .models import (
+    PhoneNumber, Settings, CallRecord, CallQueue,
+    STATUS_CHOICES, FAILED_TRANSCRIPTS
+)
+from .dial_queue import QUEUE_PRIORITY_MANUAL
 from .tasks import process_phone_number
+from .phone_parsing import iter_lines, iter_number_batches, parse_with_llm, UnparsedLines
 import json
-import requests
-import os
 from django.conf import settings
 import logging
 logger = logging.getLogger(__name__)
 
+# Сколько номеров из загрузки добавлять за одну транзакцию
+IMPORT_CHUNK_SIZE = 5000
+
 class PhoneNumberListView(ListView):
+    """
+    Список номеров с фильтром по статусу, поиском по началу номера и
+    keyset-пагинацией по id: страница выбирается условием id < after
+    (или id > before при переходе назад), без OFFSET и COUNT(*).
+    """
     model = PhoneNumber
     template_name = 'phone_numbers/list.html'
     context_object_name = 'phone_numbers'
+    page_size = 50
+    
+    def _cursor(self, name):
+        try:
+            return int(self.request.GET.get(name, ''))
+        except ValueError:
+            return None
+    
+    def get_queryset(self):
+        queryset = PhoneNumber.objects.annotate(
+            # Все счетчики строки считаются в том же запросе
+            transcribed_count=Count(
+                'call_records',
+                filter=Q(call_records__transcript__gt='') & ~Q(call_records__transcript__in=FAILED_TRANSCRIPTS)
+            )
+        )
+        
+        self.status = self.request.GET.get('status', '')
+        if self.status in dict(STATUS_CHOICES):
+            queryset = queryset.filter(status=self.status)
+        else:
+            self.status = ''
+        
+        self.search = self.request.GET.get('q', '').strip()
+        digits = ''.join(char for char in self.search if char.isdigit())
+        if digits:
+            # Поиск по префиксу использует индекс на number
+            queryset = queryset.filter(Q(number__startswith=digits) | Q(number__startswith='+' + digits))
+        
+        after = self._cursor('after')
+        before = self._cursor('before')
+        if before is not None:
+            page = list(queryset.filter(id__gt=before).order_by('id')[:self.page_size + 1])
+            self.has_previous = len(page) > self.page_size
+            self.has_next = True
+            page = page[:self.page_size][::-1]
+        else:
+            if after is not None:
+                queryset = queryset.filter(id__lt=after)
+            page = list(queryset.order_by('-id')[:self.page_size + 1])
+            self.has_next = len(page) > self.page_size
+            self.has_previous = after is not None
+            page = page[:self.page_size]
+        return page
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['settings'] = Settings.objects.all()
+        page = context['phone_numbers']
+        filters = {key: value for key, value in (('status', self.status), ('q', self.search)) if value}
+        if page and self.has_next:
+            context['next_query'] = urlencode({**filters, 'after': page[-1].id})
+        if page and self.has_previous:
+            context['previous_query'] = urlencode({**filters, 'before': page[0].id})
+        context['status_choices'] = STATUS_CHOICES
+        context['status'] = self.status
+        context['search'] = self.search
         return context
 
 class PhoneNumberCreateView(CreateView):
@@ -57,81 +122,46 @@ class PhoneNumberCreateView(CreateView):
             messages.error(self.request, f'Произошла ошибка при добавлении номера: {str(e)}')
             return self.form_invalid(form)
 
-def extract_phone_numbers(text):
-    """
-    Простой парсер для извлечения телефонных номеров из текста
-    """
-    import re
-    # Ищем номера в форматах: +1234567890, 1234567890, +1-234-567-890 и т.д.
-    pattern = r'[\+]?[0-9][0-9\-\(\)]{8,}[0-9]'
-    numbers = re.findall(pattern, text)
-    # Очищаем номера от всех символов кроме цифр и +
-    cleaned_numbers = []
-    for number in numbers:
-        cleaned = ''.join(char for char in number if char.isdigit() or char == '+')
-        if len(cleaned) >= 10:  # Проверяем минимальную длину номера
-            cleaned_numbers.append(cleaned)
-    return cleaned_numbers
-
-
 def phone_number_create_multiple(request):
     if request.method == 'POST':
-        raw_numbers = request.POST.get('phone_numbers', '')
+        upload = request.FILES.get('phone_file')
+        use_llm = request.POST.get('use_llm') == 'on'
         
-        # Отправляем запрос к ChatGPT для обработки номеров
         try:
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-3.5-turbo",
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are a phone number parser. Extract all phone numbers from the input text and return them as a JSON array of strings. Each number should contain only digits, no spaces or special characters. Example output: [\"79991234567\",\"78889999999\"]"
-                        },
-                        {
-                            "role": "user",
-                            "content": raw_numbers
-                        }
-                    ]
-                }
-            )
+            # Номера разбираются локально и добавляются пачками по мере чтения
+            if upload:
+                lines = iter_lines(upload)
+            else:
+                lines = request.POST.get('phone_numbers', '').splitlines()
+            
+            added_count = 0
+            duplicate_count = 0
+            unparsed = UnparsedLines()
+            for numbers in iter_number_batches(lines, IMPORT_CHUNK_SIZE, unparsed):
+                added, duplicates = PhoneNumber.bulk_import(numbers)
+                added_count += added
+                duplicate_count += duplicates
             
-            if response.status_code == 200:
+            # Модель разбирает только строки, с которыми не справился локальный разбор
+            unparsed_count = unparsed.count
+            if unparsed.lines and use_llm:
                 try:
-                    # Получаем массив номеров из ответа ChatGPT
-                    numbers = json.loads(response.json()['choices'][0]['message']['content'])
-                    print("\n\n\n\n")
-                    print(numbers)
-                    print("\n\n\n\n")
-                    added_count = 0
-                    duplicate_count = 0
-                    
-                    for number in numbers:
-                        try:
-                            # Пытаемся создать новый номер
-                            phone = PhoneNumber.objects.create(number=number)
-                            # Запускаем задачу обзвона для нового номера
-                            phone.add_to_queue()
-                            added_count += 1
-                        except IntegrityError:
-                            # Если номер уже существует, вызываем метод recall()
-                            phone = PhoneNumber.objects.get(number=number)
-                            phone.recall()
-                            duplicate_count += 1
-                    
-                    messages.success(request, 
-                        f'Добавлено {added_count} новых номеров. '
-                        f'{duplicate_count} номеров отправлено на повторный обзвон.')
-                    
-                except (json.JSONDecodeError, KeyError, IndexError) as e:
+                    llm_numbers, parsed_lines = parse_with_llm(unparsed.lines)
+                    added, duplicates = PhoneNumber.bulk_import(llm_numbers)
+                    added_count += added
+                    duplicate_count += duplicates
+                    unparsed_count -= parsed_lines
+                except (json.JSONDecodeError, TypeError) as e:
                     messages.error(request, f'Ошибка при обработке ответа от ChatGPT: {str(e)}')
-            else:
-                messages.error(request, f'Ошибка при обращении к ChatGPT: {response.status_code}')
+                except Exception as e:
+                    # Номера, разобранные локально, уже добавлены
+                    messages.error(request, f'Ошибка при обращении к ChatGPT: {str(e)}')
+            
+            messages.success(request, 
+                f'Добавлено {added_count} новых номеров. '
+                f'{duplicate_count} номеров отправлено на повторный обзвон.')
+            if unparsed_count:
+                messages.warning(request, f'Не удалось распознать строк: {unparsed_count}.')
         except Exception as e:
             messages.error(request, f'Произошла ошибка: {str(e)}')
     
@@ -177,7 +207,7 @@ def recall_phone_number(request, number):
     """Повторный набор номера"""
     try:
         phone_number = get_object_or_404(PhoneNumber, number=number)
-        phone_number.recall(reset_counter=True)
+        phone_number.recall(reset_counter=True, priority=QUEUE_PRIORITY_MANUAL)
         messages.success(request, f'Номер {number} добавлен в очередь для повторного набора.')
     except:
         messages.error(request, f'Номер телефона {number} не найден.')
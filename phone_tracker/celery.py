@@ -8,6 +8,24 @@ app = Celery('phone_tracker')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+# Каждая стадия обрабатывается своей очередью и своим пулом воркеров,
+# чтобы тяжелая расшифровка не задерживала звонки и наоборот
+app.conf.task_default_queue = 'maintenance'
+app.conf.task_routes = {
+    'phone_numbers.tasks.process_phone_number': {'queue': 'dial'},
+    'phone_numbers.tasks.process_call_queue': {'queue': 'dial'},
+    'phone_numbers.tasks.check_recordings': {'queue': 'transcribe'},
+    'phone_numbers.tasks.transcribe_call_record': {'queue': 'transcribe'},
+    'phone_numbers.tasks.process_unprocessed_recordings': {'queue': 'transcribe'},
+    'phone_numbers.tasks.generate_summary': {'queue': 'summarize'},
+    'phone_numbers.tasks.process_missing_summaries': {'queue': 'summarize'},
+    'phone_numbers.tasks.reconcile_recordings': {'queue': 'maintenance'},
+    'phone_numbers.tasks.schedule_recall': {'queue': 'maintenance'},
+    'phone_numbers.tasks.check_stuck_calls': {'queue': 'maintenance'},
+    'phone_numbers.tasks.check_completed_status': {'queue': 'maintenance'},
+    'phone_numbers.tasks.check_failed_transcriptions': {'queue': 'maintenance'},
+}
+
 # Периодические задачи
 app.conf.beat_schedule = {
     'process-unprocessed-recordings': {
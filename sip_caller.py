@@ -2,6 +2,7 @@ import pjsua as pj
 import wave
 import time
 import sys
+import threading
 import os
 from datetime import datetime
 from dotenv import load_dotenv
@@ -24,6 +25,7 @@ class CallCallback(pj.CallCallback):
         self.recorder_id = None
         self.recording_filename = None
         self.phone_number = None
+        self.disconnected = threading.Event()
 
     def on_state(self):
         print(f"Call state: {self.call.info().state_text}")
@@ -35,6 +37,7 @@ class CallCallback(pj.CallCallback):
                 except pj.Error as e:
                     print(f"Error destroying recorder: {str(e)}")
                 self.recorder_id = None
+            self.disconnected.set()
 
     def on_media_state(self):
         if self.call.info().media_state == pj.MediaState.ACTIVE:
@@ -100,8 +103,10 @@ def make_call(lib, acc, number, domain="nyc.us.out.didww.com"):
         callback = CallCallback()
         callback.phone_number = number  # Store phone number in callback
         call = acc.make_call(uri, cb=callback)
-        time.sleep(30)  # Wait for call to finish
-        call.hangup()
+        # Wait for the remote side to hang up, but no longer than 30 seconds
+        if not callback.disconnected.wait(30):
+            call.hangup()
+            callback.disconnected.wait(5)
         print(f"Call ended: {number}")
         
         # Return the recording filename if available